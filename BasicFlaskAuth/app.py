@@ -1,8 +1,12 @@
+import os
+
 from flask import Flask, request, abort
-import json
 from functools import wraps
-from jose import jwt
-from urllib.request import urlopen
+from jose import jwk, jwt
+from jose.utils import base64url_decode
+
+from jwks import JWKSCache, JWKSError
+from tokens import TokenCache
 
 
 app = Flask(__name__)
@@ -11,6 +15,15 @@ AUTH0_DOMAIN = @TODO_REPLACE_WITH_YOUR_DOMAIN
 ALGORITHMS = ['RS256']
 API_AUDIENCE = @TODO_REPLACE_WITH_YOUR_API_AUDIENCE
 
+# The signing keys, fetched and constructed into public keys once and refreshed in the
+# background instead of on every request (JWKS_URL points the app at another key set,
+# e.g. a local stub server for testing)
+JWKS_URL = os.environ.get('JWKS_URL', f'https://{AUTH0_DOMAIN}/.well-known/jwks.json')
+jwks_cache = JWKSCache(JWKS_URL, construct=lambda key: jwk.construct(key, ALGORITHMS[0]))
+
+# The payloads of the tokens verified last, so a token sent again is not verified again
+token_cache = TokenCache()
+
 
 class AuthError(Exception):
     def __init__(self, error, status_code):
@@ -52,33 +65,38 @@ def get_token_auth_header():
 
 
 def verify_decode_jwt(token):
-    jsonurl = urlopen(f'https://{AUTH0_DOMAIN}/.well-known/jwks.json')
-    jwks = json.loads(jsonurl.read())
     unverified_header = jwt.get_unverified_header(token)
-    rsa_key = {}
-    if 'kid' not in unverified_header:
+    if 'kid' not in unverified_header or unverified_header.get('alg') not in ALGORITHMS:
         raise AuthError({
             'code': 'invalid_header',
             'description': 'Authorization malformed.'
         }, 401)
 
-    for key in jwks['keys']:
-        if key['kid'] == unverified_header['kid']:
-            rsa_key = {
-                'kty': key['kty'],
-                'kid': key['kid'],
-                'use': key['use'],
-                'n': key['n'],
-                'e': key['e']
-            }
+    try:
+        rsa_key = jwks_cache.get_key(unverified_header['kid'])
+    except JWKSError:
+        raise AuthError({
+            'code': 'jwks_unavailable',
+            'description': 'Unable to fetch the signing keys.'
+        }, 503)
+
     if rsa_key:
+        signing_input, signature = token.encode('utf-8').rsplit(b'.', 1)
+        if not rsa_key.verify(signing_input, base64url_decode(signature)):
+            raise AuthError({
+                'code': 'invalid_signature',
+                'description': 'Signature verification failed.'
+            }, 401)
+
         try:
+            # The signature was verified above, only the claims are left to validate
             payload = jwt.decode(
                 token,
-                rsa_key,
+                {},
                 algorithms=ALGORITHMS,
                 audience=API_AUDIENCE,
-                issuer='https://' + AUTH0_DOMAIN + '/'
+                issuer='https://' + AUTH0_DOMAIN + '/',
+                options={'verify_signature': False}
             )
 
             return payload
@@ -110,7 +128,9 @@ def requires_auth(f):
     def wrapper(*args, **kwargs):
         token = get_token_auth_header()
         try:
-            payload = verify_decode_jwt(token)
+            payload = token_cache.get(token)
+            if payload is None:
+                payload = token_cache.put(token, verify_decode_jwt(token))
         except:
             abort(401)
         return f(payload, *args, **kwargs)
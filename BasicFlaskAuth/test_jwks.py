@@ -0,0 +1,154 @@
+import json
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from jwks import JWKSCache, JWKSError
+
+
+class StubJWKS:
+    """A key set served on a local port, whose keys and failures the tests control
+    """
+
+    def __init__(self, kids):
+        self.kids = list(kids)
+        self.delay = 0
+        self.fail = False
+        self.hits = 0
+        self._lock = threading.Lock()
+
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                with stub._lock:
+                    stub.hits += 1
+                time.sleep(stub.delay)
+
+                if stub.fail:
+                    self.send_error(503)
+                    return
+
+                body = json.dumps({'keys': [{'kid': kid, 'kty': 'RSA'} for kid in stub.kids]}).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = 'http://127.0.0.1:{}/.well-known/jwks.json'.format(self.server.server_address[1])
+        threading.Thread(target=self.server.serve_forever, kwargs={'poll_interval': 0.05}, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class JWKSCacheTestCase(unittest.TestCase):
+    """This class represents the JWKS cache test case"""
+
+    def setUp(self):
+        self.stub = StubJWKS(['first'])
+
+    def tearDown(self):
+        self.stub.close()
+
+    def wait_for(self, condition, timeout=5):
+        deadline = time.monotonic() + timeout
+        while not condition() and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    def test_get_key(self):
+        cache = JWKSCache(self.stub.url)
+
+        self.assertEqual(cache.get_key('first')['kid'], 'first')
+        self.assertEqual(cache.get_key('first')['kid'], 'first')
+        self.assertEqual(self.stub.hits, 1)
+
+    def test_construct_key(self):
+        cache = JWKSCache(self.stub.url, construct=lambda key: key['kid'].upper())
+
+        self.assertEqual(cache.get_key('first'), 'FIRST')
+
+    def test_unknown_kid_refetches_once(self):
+        cache = JWKSCache(self.stub.url, min_interval=0.1)
+        cache.get_key('first')
+        time.sleep(0.15)
+
+        self.stub.kids.append('rotated')
+        self.stub.delay = 0.2
+        barrier = threading.Barrier(8)
+        keys = []
+
+        def lookup():
+            barrier.wait()
+            keys.append(cache.get_key('rotated'))
+
+        threads = [threading.Thread(target=lookup) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual([key['kid'] for key in keys], ['rotated'] * 8)
+        self.assertEqual(self.stub.hits, 2)
+
+    def test_unknown_kid_not_in_key_set(self):
+        cache = JWKSCache(self.stub.url, min_interval=0)
+        cache.get_key('first')
+
+        self.assertIsNone(cache.get_key('missing'))
+        self.assertEqual(self.stub.hits, 2)
+
+    def test_stale_keys_served_while_refresh_fails(self):
+        cache = JWKSCache(self.stub.url, ttl=0.2, refresh_ahead=0, min_interval=0, max_stale=60)
+        cache.get_key('first')
+        time.sleep(0.25)
+
+        self.stub.fail = True
+        # an expiring key set is refreshed in the background, the lookup is answered from the cache
+        self.assertEqual(cache.get_key('first')['kid'], 'first')
+        self.wait_for(lambda: cache._error is not None)
+        self.assertEqual(self.stub.hits, 2)
+
+        # a refetch for an unknown kid fails, the cached keys are kept
+        self.assertIsNone(cache.get_key('rotated'))
+        self.assertEqual(self.stub.hits, 3)
+        self.assertEqual(cache.get_key('first')['kid'], 'first')
+
+    def test_stale_keys_not_served_past_max_stale(self):
+        cache = JWKSCache(self.stub.url, ttl=0.1, refresh_ahead=0, min_interval=0, max_stale=0.1)
+        cache.get_key('first')
+
+        self.stub.fail = True
+        time.sleep(0.25)
+        with self.assertRaises(JWKSError):
+            cache.get_key('first')
+
+    def test_refresh_is_rate_limited(self):
+        cache = JWKSCache(self.stub.url, min_interval=60)
+        cache.get_key('first')
+
+        for _ in range(5):
+            self.assertIsNone(cache.get_key('rotated'))
+            cache.refresh()
+        self.assertEqual(self.stub.hits, 1)
+
+    def test_failed_fetch_is_rate_limited(self):
+        self.stub.fail = True
+        cache = JWKSCache(self.stub.url, min_interval=60)
+
+        for _ in range(5):
+            with self.assertRaises(JWKSError):
+                cache.get_key('first')
+        self.assertEqual(self.stub.hits, 1)
+
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()
@@ -5,13 +5,19 @@
 import json
 import dateutil.parser
 import babel
-from flask import Flask, render_template, request, Response, flash, redirect, url_for
+from datetime import datetime
+from itertools import groupby, chain
+from flask import Flask, render_template, request, Response, flash, redirect, url_for, abort, jsonify, session
 from flask_moment import Moment
 from flask_sqlalchemy import SQLAlchemy
+from flask_migrate import Migrate
+from sqlalchemy import func, case, event, inspect
 import logging
 from logging import Formatter, FileHandler
 from flask_wtf import Form
 from forms import *
+from profiling import QueryProfiler
+from cache import PageCache, MemoryBackend, RedisBackend
 #----------------------------------------------------------------------------#
 # App Config.
 #----------------------------------------------------------------------------#
@@ -20,8 +26,14 @@ app = Flask(__name__)
 moment = Moment(app)
 app.config.from_object('config')
 db = SQLAlchemy(app)
+migrate = Migrate(app, db)
+profiler = QueryProfiler(app)
 
-# TODO: connect to a local postgresql database
+if app.config.get('PAGE_CACHE_REDIS_URL'):
+  import redis
+  page_cache = PageCache(RedisBackend(redis.Redis.from_url(app.config['PAGE_CACHE_REDIS_URL'])))
+else:
+  page_cache = PageCache(MemoryBackend(app.config.get('PAGE_CACHE_SIZE', 1024)))
 
 #----------------------------------------------------------------------------#
 # Models.
@@ -29,6 +41,10 @@ db = SQLAlchemy(app)
 
 class Venue(db.Model):
     __tablename__ = 'Venue'
+    # trigram index serving the name search on Postgres (a plain index elsewhere)
+    __table_args__ = (
+        db.Index('ix_Venue_name_trgm', 'name', postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'}),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String)
@@ -36,13 +52,21 @@ class Venue(db.Model):
     state = db.Column(db.String(120))
     address = db.Column(db.String(120))
     phone = db.Column(db.String(120))
+    genres = db.Column(db.String(120))
     image_link = db.Column(db.String(500))
     facebook_link = db.Column(db.String(120))
+    website = db.Column(db.String(120))
+    seeking_talent = db.Column(db.Boolean, nullable=False, default=False)
+    seeking_description = db.Column(db.String(500))
 
-    # TODO: implement any missing fields, as a database migration using Flask-Migrate
+    shows = db.relationship('Show', backref='venue', lazy=True, cascade='all, delete-orphan', passive_deletes=True)
 
 class Artist(db.Model):
     __tablename__ = 'Artist'
+    # trigram index serving the name search on Postgres (a plain index elsewhere)
+    __table_args__ = (
+        db.Index('ix_Artist_name_trgm', 'name', postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'}),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String)
@@ -52,17 +76,265 @@ class Artist(db.Model):
     genres = db.Column(db.String(120))
     image_link = db.Column(db.String(500))
     facebook_link = db.Column(db.String(120))
+    website = db.Column(db.String(120))
+    seeking_venue = db.Column(db.Boolean, nullable=False, default=False)
+    seeking_description = db.Column(db.String(500))
+
+    shows = db.relationship('Show', backref='artist', lazy=True, cascade='all, delete-orphan', passive_deletes=True)
+
+class Show(db.Model):
+    __tablename__ = 'Show'
+    # the shows of a venue or an artist are always read in start time order
+    __table_args__ = (
+        db.Index('ix_Show_venue_id_start_time', 'venue_id', 'start_time'),
+        db.Index('ix_Show_artist_id_start_time', 'artist_id', 'start_time'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    venue_id = db.Column(db.Integer, db.ForeignKey('Venue.id', ondelete='CASCADE'), nullable=False)
+    artist_id = db.Column(db.Integer, db.ForeignKey('Artist.id', ondelete='CASCADE'), nullable=False)
+    start_time = db.Column(db.DateTime, nullable=False)
+
+class VenueSummary(db.Model):
+    # read model of /venues: every venue with its area and number of upcoming shows,
+    # refreshed by refresh_venue_summaries() in the transactions writing venues or shows
+    __tablename__ = 'VenueSummary'
+    __table_args__ = (
+        db.Index('ix_VenueSummary_area', 'state', 'city', 'name'),
+    )
+
+    venue_id = db.Column(db.Integer, db.ForeignKey('Venue.id', ondelete='CASCADE'), primary_key=True)
+    name = db.Column(db.String)
+    city = db.Column(db.String(120))
+    state = db.Column(db.String(120))
+    num_upcoming_shows = db.Column(db.Integer, nullable=False, default=0)
+    # start time of the next upcoming show, when num_upcoming_shows goes down
+    refresh_at = db.Column(db.DateTime)
+
+#----------------------------------------------------------------------------#
+# Queries.
+#----------------------------------------------------------------------------#
+
+def split_genres(genres):
+  return [genre for genre in (genres or '').split(',') if genre]
+
+def fill_venue(venue, form):
+  # copies the fields of a submitted VenueForm to a venue
+  venue.name = form.name.data
+  venue.city = form.city.data
+  venue.state = form.state.data
+  venue.address = form.address.data
+  venue.phone = form.phone.data
+  venue.image_link = form.image_link.data
+  venue.genres = ','.join(form.genres.data or [])
+  venue.facebook_link = form.facebook_link.data
+
+def fill_artist(artist, form):
+  # copies the fields of a submitted ArtistForm to an artist
+  artist.name = form.name.data
+  artist.city = form.city.data
+  artist.state = form.state.data
+  artist.phone = form.phone.data
+  artist.image_link = form.image_link.data
+  artist.genres = ','.join(form.genres.data or [])
+  artist.facebook_link = form.facebook_link.data
+
+def upcoming_show_counts(key, ids, now=None):
+  # number of upcoming shows and start time of the next one per venue or artist (key is
+  # Show.venue_id or Show.artist_id, ids the venues or artists) in a single grouped query,
+  # as a subquery with the columns id, num_upcoming_shows and next_show_time
+  return db.session.query(key.label('id'), func.count(Show.id).label('num_upcoming_shows'),
+      func.min(Show.start_time).label('next_show_time')) \
+    .filter(key.in_(ids), Show.start_time > (now or datetime.now())) \
+    .group_by(key) \
+    .subquery()
+
+def refresh_venue_summaries(venue_ids, now=None):
+  # recomputes the VenueSummary rows of some venues within the current transaction
+  venue_ids = sorted(venue_ids)
+  # the venues are locked first (in id order, so concurrent refreshes cannot deadlock): a
+  # concurrent refresh of the same venues waits for this transaction to end, then counts
+  # the shows it committed instead of rewriting the rows with its own count only
+  db.session.query(Venue.id).filter(Venue.id.in_(venue_ids)).order_by(Venue.id).with_for_update().all()
+  upcoming = upcoming_show_counts(Show.venue_id, venue_ids, now)
+  rows = db.session.query(Venue.id, Venue.name, Venue.city, Venue.state,
+      func.coalesce(upcoming.c.num_upcoming_shows, 0), upcoming.c.next_show_time) \
+    .outerjoin(upcoming, upcoming.c.id == Venue.id) \
+    .filter(Venue.id.in_(venue_ids)) \
+    .all()
+
+  summaries = VenueSummary.__table__
+  db.session.execute(summaries.delete().where(summaries.c.venue_id.in_(venue_ids)))
+  if rows:
+    db.session.execute(summaries.insert(), [{
+      "venue_id": venue_id,
+      "name": name,
+      "city": city,
+      "state": state,
+      "num_upcoming_shows": num_upcoming_shows,
+      "refresh_at": next_show_time,
+    } for venue_id, name, city, state, num_upcoming_shows, next_show_time in rows])
+
+def venue_summaries():
+  # all VenueSummary rows in area order, refreshing the rows of venues
+  # with shows that started since they were computed
+  query = VenueSummary.query.order_by(VenueSummary.state, VenueSummary.city, VenueSummary.name, VenueSummary.venue_id)
+  now = datetime.now()
+  rows = query.all()
+  stale = [row.venue_id for row in rows if row.refresh_at is not None and row.refresh_at <= now]
+  if stale:
+    refresh_venue_summaries(stale, now)
+    db.session.commit()
+    rows = query.all()
+  return rows
+
+# Number of results of a search page and of a typeahead answer
+SEARCH_LIMIT = 50
+TYPEAHEAD_LIMIT = 10
+
+# Terms shorter than a trigram cannot use the name indexes
+TRIGRAM_LENGTH = 3
+
+fts_tables = {}
+
+def has_fts(model):
+  # whether the SQLite FTS5 index of the names of a model exists (it is created by the migrations)
+  name = '{}_fts'.format(model.__tablename__)
+  if name not in fts_tables:
+    fts_tables[name] = db.engine.dialect.name == 'sqlite' and db.engine.has_table(name)
+  return fts_tables[name]
+
+def search_names(model, key, term, limit=SEARCH_LIMIT, now=None):
+  # venues or artists (model Venue or Artist, key Show.venue_id or Show.artist_id) with a name
+  # containing the term, case-insensitively, best matches first, in a single query that also
+  # returns the number of upcoming shows of every result and the total number of matches
+  #   Postgres: ILIKE, served by the pg_trgm index of the names, names starting with the term first
+  #   SQLite: MATCH on the FTS5 trigram index of the names, ranked by bm25
+  #   shorter terms and other databases: a LIKE scan
+  num_upcoming_shows = db.session.query(func.count(Show.id)) \
+    .filter(key == model.id, Show.start_time > (now or datetime.now())) \
+    .correlate(model) \
+    .label('num_upcoming_shows')
+  query = db.session.query(model.id, model.name, num_upcoming_shows, func.count().over().label('total'))
+
+  if len(term) >= TRIGRAM_LENGTH and has_fts(model):
+    table = '{}_fts'.format(model.__tablename__)
+    fts = db.table(table, db.column('rowid'), db.column('rank'))
+    query = query.join(fts, fts.c.rowid == model.id) \
+      .filter(db.literal_column('"{}"'.format(table)).op('MATCH')('"{}"'.format(term.replace('"', '""')))) \
+      .order_by(fts.c.rank, model.name)
+  else:
+    escaped = term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    prefix = case([(model.name.ilike(escaped + '%', escape='\\'), 0)], else_=1)
+    query = query.filter(model.name.ilike('%' + escaped + '%', escape='\\')) \
+      .order_by(prefix, func.length(model.name), model.name)
+
+  rows = query.limit(limit).all()
+  return {
+    "count": rows[0].total if rows else 0,
+    "data": [{
+      "id": row.id,
+      "name": row.name,
+      "num_upcoming_shows": row.num_upcoming_shows,
+    } for row in rows]
+  }
+
+def split_shows(shows, now=None):
+  # splits shows ordered by start time into past and upcoming shows
+  now = now or datetime.now()
+  past_shows = [show for show in shows if show['start_time'] <= now]
+  upcoming_shows = [show for show in shows if show['start_time'] > now]
+  return past_shows, upcoming_shows
 
-    # TODO: implement any missing fields, as a database migration using Flask-Migrate
+#----------------------------------------------------------------------------#
+# Write tracking.
+#----------------------------------------------------------------------------#
 
-# TODO Implement Show and Artist models, and complete all model relationships and properties, as a database migration.
+# the ids of the venues and artists written in a transaction are collected in session.info
+# on every flush; right before the transaction commits the venue summaries are refreshed,
+# once it committed the cached pages of the venues and artists are given a new version
+# (a venue page lists the artists of its shows and the other way round, so both sides
+# of the shows of a written venue or artist are bumped)
+
+def touch(session, kind, ids):
+  session.info.setdefault('written_' + kind, set()).update(entity_id for entity_id in ids if entity_id is not None)
+
+@event.listens_for(db.session, 'before_flush')
+def collect_deleted_shows(session, flush_context, instances):
+  # shows of deleted venues and artists are deleted by the database, their other side is looked up first
+  venue_ids = [venue.id for venue in session.deleted if isinstance(venue, Venue)]
+  artist_ids = [artist.id for artist in session.deleted if isinstance(artist, Artist)]
+  if venue_ids:
+    touch(session, 'artists', [artist_id for artist_id, in session.query(Show.artist_id).filter(Show.venue_id.in_(venue_ids))])
+  if artist_ids:
+    touch(session, 'venues', [venue_id for venue_id, in session.query(Show.venue_id).filter(Show.artist_id.in_(artist_ids))])
+
+@event.listens_for(db.session, 'before_flush')
+def collect_moved_shows(session, flush_context, instances):
+  # changed shows leave the venue and artist they had before; their attributes have no history
+  # once expired (e.g. by a commit), so those are read from the database before the flush
+  show_ids = [inspect(show).identity[0] for show in session.dirty if isinstance(show, Show) and inspect(show).identity]
+  if show_ids:
+    rows = session.query(Show.venue_id, Show.artist_id).filter(Show.id.in_(show_ids)).all()
+    touch(session, 'venues', [venue_id for venue_id, artist_id in rows])
+    touch(session, 'artists', [artist_id for venue_id, artist_id in rows])
+
+@event.listens_for(db.session, 'after_flush')
+def collect_written(session, flush_context):
+  venue_ids = []
+  artist_ids = []
+  for instance in chain(session.new, session.dirty, session.deleted):
+    if isinstance(instance, Venue):
+      venue_ids.append(instance.id)
+    elif isinstance(instance, Artist):
+      artist_ids.append(instance.id)
+    elif isinstance(instance, Show):
+      state = inspect(instance)
+      venue_ids.append(instance.venue_id)
+      venue_ids.extend(state.attrs.venue_id.history.deleted or ())
+      artist_ids.append(instance.artist_id)
+      artist_ids.extend(state.attrs.artist_id.history.deleted or ())
+  touch(session, 'venues', venue_ids)
+  touch(session, 'artists', artist_ids)
+
+@event.listens_for(db.session, 'before_commit')
+def refresh_written(session):
+  session.flush()
+  venue_ids = session.info.pop('written_venues', set())
+  artist_ids = session.info.pop('written_artists', set())
+  if venue_ids:
+    refresh_venue_summaries(venue_ids)
+
+  pages = session.info.setdefault('written_pages', {'venue': set(), 'artist': set()})
+  pages['venue'].update(venue_ids)
+  pages['artist'].update(artist_ids)
+  if venue_ids:
+    pages['artist'].update(artist_id for artist_id, in session.query(Show.artist_id).filter(Show.venue_id.in_(venue_ids)).distinct())
+  if artist_ids:
+    pages['venue'].update(venue_id for venue_id, in session.query(Show.venue_id).filter(Show.artist_id.in_(artist_ids)).distinct())
+
+@event.listens_for(db.session, 'after_commit')
+def bump_written_pages(session):
+  for kind, ids in session.info.pop('written_pages', {}).items():
+    page_cache.bump(kind, ids)
+
+@event.listens_for(db.session, 'after_rollback')
+def forget_written(session):
+  for key in ['written_venues', 'written_artists', 'written_pages']:
+    session.info.pop(key, None)
+
+@app.cli.command('refresh-venue-summaries')
+def refresh_all_venue_summaries():
+  # rebuilds the summaries of all venues
+  refresh_venue_summaries([venue_id for venue_id, in db.session.query(Venue.id)])
+  db.session.commit()
 
 #----------------------------------------------------------------------------#
 # Filters.
 #----------------------------------------------------------------------------#
 
 def format_datetime(value, format='medium'):
-  date = dateutil.parser.parse(value)
+  date = dateutil.parser.parse(value) if isinstance(value, str) else value
   if format == 'full':
       format="EEEE MMMM, d, y 'at' h:mma"
   elif format == 'medium':
@@ -85,129 +357,73 @@ def index():
 
 @app.route('/venues')
 def venues():
-  # TODO: replace with real venues data.
-  #       num_shows should be aggregated based on number of upcoming shows per venue.
-  data=[{
-    "city": "San Francisco",
-    "state": "CA",
+  # venues grouped by area with their number of upcoming shows, read from
+  # the VenueSummary table in area order: a single indexed query
+  data = [{
+    "city": city,
+    "state": state,
     "venues": [{
-      "id": 1,
-      "name": "The Musical Hop",
-      "num_upcoming_shows": 0,
-    }, {
-      "id": 3,
-      "name": "Park Square Live Music & Coffee",
-      "num_upcoming_shows": 1,
-    }]
-  }, {
-    "city": "New York",
-    "state": "NY",
-    "venues": [{
-      "id": 2,
-      "name": "The Dueling Pianos Bar",
-      "num_upcoming_shows": 0,
-    }]
-  }]
+      "id": row.venue_id,
+      "name": row.name,
+      "num_upcoming_shows": row.num_upcoming_shows,
+    } for row in area],
+  } for (state, city), area in groupby(venue_summaries(), key=lambda row: (row.state, row.city))]
   return render_template('pages/venues.html', areas=data);
 
 @app.route('/venues/search', methods=['POST'])
 def search_venues():
-  # TODO: implement search on artists with partial string search. Ensure it is case-insensitive.
-  # seach for Hop should return "The Musical Hop".
-  # search for "Music" should return "The Musical Hop" and "Park Square Live Music & Coffee"
-  response={
-    "count": 1,
-    "data": [{
-      "id": 2,
-      "name": "The Dueling Pianos Bar",
-      "num_upcoming_shows": 0,
-    }]
-  }
-  return render_template('pages/search_venues.html', results=response, search_term=request.form.get('search_term', ''))
+  # case-insensitive partial match on the venue names, e.g. "Music" finds
+  # "The Musical Hop" and "Park Square Live Music & Coffee"
+  search_term = request.form.get('search_term', '').strip()
+  response = search_names(Venue, Show.venue_id, search_term)
+  return render_template('pages/search_venues.html', results=response, search_term=search_term)
 
 @app.route('/venues/<int:venue_id>')
 def show_venue(venue_id):
-  # shows the venue page with the given venue_id
-  # TODO: replace with real venue data from the venues table, using venue_id
-  data1={
-    "id": 1,
-    "name": "The Musical Hop",
-    "genres": ["Jazz", "Reggae", "Swing", "Classical", "Folk"],
-    "address": "1015 Folsom Street",
-    "city": "San Francisco",
-    "state": "CA",
-    "phone": "123-123-1234",
-    "website": "https://www.themusicalhop.com",
-    "facebook_link": "https://www.facebook.com/TheMusicalHop",
-    "seeking_talent": True,
-    "seeking_description": "We are on the lookout for a local artist to play every two weeks. Please call us.",
-    "image_link": "https://images.unsplash.com/photo-1543900694-133f37abaaa5?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=400&q=60",
-    "past_shows": [{
-      "artist_id": 4,
-      "artist_name": "Guns N Petals",
-      "artist_image_link": "https://images.unsplash.com/photo-1549213783-8284d0336c4f?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=300&q=80",
-      "start_time": "2019-05-21T21:30:00.000Z"
-    }],
-    "upcoming_shows": [],
-    "past_shows_count": 1,
-    "upcoming_shows_count": 0,
-  }
-  data2={
-    "id": 2,
-    "name": "The Dueling Pianos Bar",
-    "genres": ["Classical", "R&B", "Hip-Hop"],
-    "address": "335 Delancey Street",
-    "city": "New York",
-    "state": "NY",
-    "phone": "914-003-1132",
-    "website": "https://www.theduelingpianos.com",
-    "facebook_link": "https://www.facebook.com/theduelingpianos",
-    "seeking_talent": False,
-    "image_link": "https://images.unsplash.com/photo-1497032205916-ac775f0649ae?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=750&q=80",
-    "past_shows": [],
-    "upcoming_shows": [],
-    "past_shows_count": 0,
-    "upcoming_shows_count": 0,
-  }
-  data3={
-    "id": 3,
-    "name": "Park Square Live Music & Coffee",
-    "genres": ["Rock n Roll", "Jazz", "Classical", "Folk"],
-    "address": "34 Whiskey Moore Ave",
-    "city": "San Francisco",
-    "state": "CA",
-    "phone": "415-000-1234",
-    "website": "https://www.parksquarelivemusicandcoffee.com",
-    "facebook_link": "https://www.facebook.com/ParkSquareLiveMusicAndCoffee",
-    "seeking_talent": False,
-    "image_link": "https://images.unsplash.com/photo-1485686531765-ba63b07845a7?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=747&q=80",
-    "past_shows": [{
-      "artist_id": 5,
-      "artist_name": "Matt Quevedo",
-      "artist_image_link": "https://images.unsplash.com/photo-1495223153807-b916f75de8c5?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=334&q=80",
-      "start_time": "2019-06-15T23:00:00.000Z"
-    }],
-    "upcoming_shows": [{
-      "artist_id": 6,
-      "artist_name": "The Wild Sax Band",
-      "artist_image_link": "https://images.unsplash.com/photo-1558369981-f9ca78462e61?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=794&q=80",
-      "start_time": "2035-04-01T20:00:00.000Z"
-    }, {
-      "artist_id": 6,
-      "artist_name": "The Wild Sax Band",
-      "artist_image_link": "https://images.unsplash.com/photo-1558369981-f9ca78462e61?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=794&q=80",
-      "start_time": "2035-04-08T20:00:00.000Z"
-    }, {
-      "artist_id": 6,
-      "artist_name": "The Wild Sax Band",
-      "artist_image_link": "https://images.unsplash.com/photo-1558369981-f9ca78462e61?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=794&q=80",
-      "start_time": "2035-04-15T20:00:00.000Z"
-    }],
-    "past_shows_count": 1,
-    "upcoming_shows_count": 1,
+  # shows the venue page with the given venue_id, from the page cache when it is current
+  cacheable = '_flashes' not in session
+  key = page_cache.key('venue', venue_id)
+  page = page_cache.get(key) if cacheable else None
+  if page is not None:
+    return page
+
+  venue = Venue.query.get_or_404(venue_id)
+  shows = db.session.query(Show.start_time, Artist.id, Artist.name, Artist.image_link) \
+    .join(Artist, Artist.id == Show.artist_id) \
+    .filter(Show.venue_id == venue_id) \
+    .order_by(Show.start_time) \
+    .all()
+
+  past_shows, upcoming_shows = split_shows([{
+    "artist_id": artist_id,
+    "artist_name": artist_name,
+    "artist_image_link": artist_image_link,
+    "start_time": start_time,
+  } for start_time, artist_id, artist_name, artist_image_link in shows])
+
+  data = {
+    "id": venue.id,
+    "name": venue.name,
+    "genres": split_genres(venue.genres),
+    "address": venue.address,
+    "city": venue.city,
+    "state": venue.state,
+    "phone": venue.phone,
+    "website": venue.website,
+    "facebook_link": venue.facebook_link,
+    "seeking_talent": venue.seeking_talent,
+    "seeking_description": venue.seeking_description,
+    "image_link": venue.image_link,
+    "past_shows": past_shows,
+    "upcoming_shows": upcoming_shows,
+    "past_shows_count": len(past_shows),
+    "upcoming_shows_count": len(upcoming_shows),
   }
-  data = list(filter(lambda d: d['id'] == venue_id, [data1, data2, data3]))[0]
-  return render_template('pages/show_venue.html', venue=data)
+  page = render_template('pages/show_venue.html', venue=data)
+  if not cacheable:
+    return page
+  # the page changes once its next show has started
+  return page_cache.set(key, page, upcoming_shows[0]['start_time'] if upcoming_shows else None)
 
 #  Create Venue
 #  ----------------------------------------------------------------
@@ -219,187 +435,145 @@ def create_venue_form():
 
 @app.route('/venues/create', methods=['POST'])
 def create_venue_submission():
-  # TODO: insert form data as a new Venue record in the db, instead
-  # TODO: modify data to be the data object returned from db insertion
-
-  # on successful db insert, flash success
-  flash('Venue ' + request.form['name'] + ' was successfully listed!')
-  # TODO: on unsuccessful db insert, flash an error instead.
-  # e.g., flash('An error occurred. Venue ' + data.name + ' could not be listed.')
-  # see: http://flask.pocoo.org/docs/1.0/patterns/flashing/
+  form = VenueForm(request.form)
+  venue = Venue()
+  fill_venue(venue, form)
+  try:
+    db.session.add(venue)
+    db.session.commit()
+    # on successful db insert, flash success
+    flash('Venue ' + venue.name + ' was successfully listed!')
+  except Exception:
+    db.session.rollback()
+    app.logger.exception('Venue could not be listed')
+    flash('An error occurred. Venue ' + form.name.data + ' could not be listed.')
   return render_template('pages/home.html')
 
 @app.route('/venues/<venue_id>', methods=['DELETE'])
 def delete_venue(venue_id):
-  # TODO: Complete this endpoint for taking a venue_id, and using
-  # SQLAlchemy ORM to delete a record. Handle cases where the session commit could fail.
-
-  # BONUS CHALLENGE: Implement a button to delete a Venue on a Venue Page, have it so that
-  # clicking that button delete it from the db then redirect the user to the homepage
-  return None
+  venue = Venue.query.get_or_404(venue_id)
+  try:
+    db.session.delete(venue)
+    db.session.commit()
+  except Exception:
+    db.session.rollback()
+    app.logger.exception('Venue could not be deleted')
+    return jsonify(success=False), 500
+  return jsonify(success=True)
 
 #  Artists
 #  ----------------------------------------------------------------
 @app.route('/artists')
 def artists():
-  # TODO: replace with real data returned from querying the database
-  data=[{
-    "id": 4,
-    "name": "Guns N Petals",
-  }, {
-    "id": 5,
-    "name": "Matt Quevedo",
-  }, {
-    "id": 6,
-    "name": "The Wild Sax Band",
-  }]
+  data = [{
+    "id": artist_id,
+    "name": name,
+  } for artist_id, name in db.session.query(Artist.id, Artist.name).order_by(Artist.name, Artist.id)]
   return render_template('pages/artists.html', artists=data)
 
 @app.route('/artists/search', methods=['POST'])
 def search_artists():
-  # TODO: implement search on artists with partial string search. Ensure it is case-insensitive.
-  # seach for "A" should return "Guns N Petals", "Matt Quevado", and "The Wild Sax Band".
-  # search for "band" should return "The Wild Sax Band".
-  response={
-    "count": 1,
-    "data": [{
-      "id": 4,
-      "name": "Guns N Petals",
-      "num_upcoming_shows": 0,
-    }]
-  }
-  return render_template('pages/search_artists.html', results=response, search_term=request.form.get('search_term', ''))
+  # case-insensitive partial match on the artist names, e.g. "band" finds "The Wild Sax Band"
+  search_term = request.form.get('search_term', '').strip()
+  response = search_names(Artist, Show.artist_id, search_term)
+  return render_template('pages/search_artists.html', results=response, search_term=search_term)
+
+@app.route('/typeahead')
+def typeahead():
+  # search box suggestions as JSON: the best few venues and artists matching ?q=
+  term = request.args.get('q', '').strip()
+  if not term:
+    return jsonify(venues=[], artists=[])
+
+  return jsonify(
+    venues=search_names(Venue, Show.venue_id, term, TYPEAHEAD_LIMIT)['data'],
+    artists=search_names(Artist, Show.artist_id, term, TYPEAHEAD_LIMIT)['data'],
+  )
 
 @app.route('/artists/<int:artist_id>')
 def show_artist(artist_id):
-  # shows the venue page with the given venue_id
-  # TODO: replace with real venue data from the venues table, using venue_id
-  data1={
-    "id": 4,
-    "name": "Guns N Petals",
-    "genres": ["Rock n Roll"],
-    "city": "San Francisco",
-    "state": "CA",
-    "phone": "326-123-5000",
-    "website": "https://www.gunsnpetalsband.com",
-    "facebook_link": "https://www.facebook.com/GunsNPetals",
-    "seeking_venue": True,
-    "seeking_description": "Looking for shows to perform at in the San Francisco Bay Area!",
-    "image_link": "https://images.unsplash.com/photo-1549213783-8284d0336c4f?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=300&q=80",
-    "past_shows": [{
-      "venue_id": 1,
-      "venue_name": "The Musical Hop",
-      "venue_image_link": "https://images.unsplash.com/photo-1543900694-133f37abaaa5?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=400&q=60",
-      "start_time": "2019-05-21T21:30:00.000Z"
-    }],
-    "upcoming_shows": [],
-    "past_shows_count": 1,
-    "upcoming_shows_count": 0,
-  }
-  data2={
-    "id": 5,
-    "name": "Matt Quevedo",
-    "genres": ["Jazz"],
-    "city": "New York",
-    "state": "NY",
-    "phone": "300-400-5000",
-    "facebook_link": "https://www.facebook.com/mattquevedo923251523",
-    "seeking_venue": False,
-    "image_link": "https://images.unsplash.com/photo-1495223153807-b916f75de8c5?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=334&q=80",
-    "past_shows": [{
-      "venue_id": 3,
-      "venue_name": "Park Square Live Music & Coffee",
-      "venue_image_link": "https://images.unsplash.com/photo-1485686531765-ba63b07845a7?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=747&q=80",
-      "start_time": "2019-06-15T23:00:00.000Z"
-    }],
-    "upcoming_shows": [],
-    "past_shows_count": 1,
-    "upcoming_shows_count": 0,
-  }
-  data3={
-    "id": 6,
-    "name": "The Wild Sax Band",
-    "genres": ["Jazz", "Classical"],
-    "city": "San Francisco",
-    "state": "CA",
-    "phone": "432-325-5432",
-    "seeking_venue": False,
-    "image_link": "https://images.unsplash.com/photo-1558369981-f9ca78462e61?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=794&q=80",
-    "past_shows": [],
-    "upcoming_shows": [{
-      "venue_id": 3,
-      "venue_name": "Park Square Live Music & Coffee",
-      "venue_image_link": "https://images.unsplash.com/photo-1485686531765-ba63b07845a7?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=747&q=80",
-      "start_time": "2035-04-01T20:00:00.000Z"
-    }, {
-      "venue_id": 3,
-      "venue_name": "Park Square Live Music & Coffee",
-      "venue_image_link": "https://images.unsplash.com/photo-1485686531765-ba63b07845a7?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=747&q=80",
-      "start_time": "2035-04-08T20:00:00.000Z"
-    }, {
-      "venue_id": 3,
-      "venue_name": "Park Square Live Music & Coffee",
-      "venue_image_link": "https://images.unsplash.com/photo-1485686531765-ba63b07845a7?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=747&q=80",
-      "start_time": "2035-04-15T20:00:00.000Z"
-    }],
-    "past_shows_count": 0,
-    "upcoming_shows_count": 3,
+  # shows the artist page with the given artist_id, from the page cache when it is current
+  cacheable = '_flashes' not in session
+  key = page_cache.key('artist', artist_id)
+  page = page_cache.get(key) if cacheable else None
+  if page is not None:
+    return page
+
+  artist = Artist.query.get_or_404(artist_id)
+  shows = db.session.query(Show.start_time, Venue.id, Venue.name, Venue.image_link) \
+    .join(Venue, Venue.id == Show.venue_id) \
+    .filter(Show.artist_id == artist_id) \
+    .order_by(Show.start_time) \
+    .all()
+
+  past_shows, upcoming_shows = split_shows([{
+    "venue_id": venue_id,
+    "venue_name": venue_name,
+    "venue_image_link": venue_image_link,
+    "start_time": start_time,
+  } for start_time, venue_id, venue_name, venue_image_link in shows])
+
+  data = {
+    "id": artist.id,
+    "name": artist.name,
+    "genres": split_genres(artist.genres),
+    "city": artist.city,
+    "state": artist.state,
+    "phone": artist.phone,
+    "website": artist.website,
+    "facebook_link": artist.facebook_link,
+    "seeking_venue": artist.seeking_venue,
+    "seeking_description": artist.seeking_description,
+    "image_link": artist.image_link,
+    "past_shows": past_shows,
+    "upcoming_shows": upcoming_shows,
+    "past_shows_count": len(past_shows),
+    "upcoming_shows_count": len(upcoming_shows),
   }
-  data = list(filter(lambda d: d['id'] == artist_id, [data1, data2, data3]))[0]
-  return render_template('pages/show_artist.html', artist=data)
+  page = render_template('pages/show_artist.html', artist=data)
+  if not cacheable:
+    return page
+  # the page changes once its next show has started
+  return page_cache.set(key, page, upcoming_shows[0]['start_time'] if upcoming_shows else None)
 
 #  Update
 #  ----------------------------------------------------------------
 @app.route('/artists/<int:artist_id>/edit', methods=['GET'])
 def edit_artist(artist_id):
-  form = ArtistForm()
-  artist={
-    "id": 4,
-    "name": "Guns N Petals",
-    "genres": ["Rock n Roll"],
-    "city": "San Francisco",
-    "state": "CA",
-    "phone": "326-123-5000",
-    "website": "https://www.gunsnpetalsband.com",
-    "facebook_link": "https://www.facebook.com/GunsNPetals",
-    "seeking_venue": True,
-    "seeking_description": "Looking for shows to perform at in the San Francisco Bay Area!",
-    "image_link": "https://images.unsplash.com/photo-1549213783-8284d0336c4f?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=300&q=80"
-  }
-  # TODO: populate form with fields from artist with ID <artist_id>
+  artist = Artist.query.get_or_404(artist_id)
+  form = ArtistForm(obj=artist)
+  form.genres.data = split_genres(artist.genres)
   return render_template('forms/edit_artist.html', form=form, artist=artist)
 
 @app.route('/artists/<int:artist_id>/edit', methods=['POST'])
 def edit_artist_submission(artist_id):
-  # TODO: take values from the form submitted, and update existing
-  # artist record with ID <artist_id> using the new attributes
-
+  artist = Artist.query.get_or_404(artist_id)
+  fill_artist(artist, ArtistForm(request.form))
+  try:
+    db.session.commit()
+  except Exception:
+    db.session.rollback()
+    app.logger.exception('Artist could not be updated')
+    flash('An error occurred. Artist ' + artist.name + ' could not be updated.')
   return redirect(url_for('show_artist', artist_id=artist_id))
 
 @app.route('/venues/<int:venue_id>/edit', methods=['GET'])
 def edit_venue(venue_id):
-  form = VenueForm()
-  venue={
-    "id": 1,
-    "name": "The Musical Hop",
-    "genres": ["Jazz", "Reggae", "Swing", "Classical", "Folk"],
-    "address": "1015 Folsom Street",
-    "city": "San Francisco",
-    "state": "CA",
-    "phone": "123-123-1234",
-    "website": "https://www.themusicalhop.com",
-    "facebook_link": "https://www.facebook.com/TheMusicalHop",
-    "seeking_talent": True,
-    "seeking_description": "We are on the lookout for a local artist to play every two weeks. Please call us.",
-    "image_link": "https://images.unsplash.com/photo-1543900694-133f37abaaa5?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=400&q=60"
-  }
-  # TODO: populate form with values from venue with ID <venue_id>
+  venue = Venue.query.get_or_404(venue_id)
+  form = VenueForm(obj=venue)
+  form.genres.data = split_genres(venue.genres)
   return render_template('forms/edit_venue.html', form=form, venue=venue)
 
 @app.route('/venues/<int:venue_id>/edit', methods=['POST'])
 def edit_venue_submission(venue_id):
-  # TODO: take values from the form submitted, and update existing
-  # venue record with ID <venue_id> using the new attributes
+  venue = Venue.query.get_or_404(venue_id)
+  fill_venue(venue, VenueForm(request.form))
+  try:
+    db.session.commit()
+  except Exception:
+    db.session.rollback()
+    app.logger.exception('Venue could not be updated')
+    flash('An error occurred. Venue ' + venue.name + ' could not be updated.')
   return redirect(url_for('show_venue', venue_id=venue_id))
 
 #  Create Artist
@@ -413,13 +587,18 @@ def create_artist_form():
 @app.route('/artists/create', methods=['POST'])
 def create_artist_submission():
   # called upon submitting the new artist listing form
-  # TODO: insert form data as a new Venue record in the db, instead
-  # TODO: modify data to be the data object returned from db insertion
-
-  # on successful db insert, flash success
-  flash('Artist ' + request.form['name'] + ' was successfully listed!')
-  # TODO: on unsuccessful db insert, flash an error instead.
-  # e.g., flash('An error occurred. Artist ' + data.name + ' could not be listed.')
+  form = ArtistForm(request.form)
+  artist = Artist()
+  fill_artist(artist, form)
+  try:
+    db.session.add(artist)
+    db.session.commit()
+    # on successful db insert, flash success
+    flash('Artist ' + artist.name + ' was successfully listed!')
+  except Exception:
+    db.session.rollback()
+    app.logger.exception('Artist could not be listed')
+    flash('An error occurred. Artist ' + form.name.data + ' could not be listed.')
   return render_template('pages/home.html')
 
 
@@ -429,44 +608,20 @@ def create_artist_submission():
 @app.route('/shows')
 def shows():
   # displays list of shows at /shows
-  # TODO: replace with real venues data.
-  #       num_shows should be aggregated based on number of upcoming shows per venue.
-  data=[{
-    "venue_id": 1,
-    "venue_name": "The Musical Hop",
-    "artist_id": 4,
-    "artist_name": "Guns N Petals",
-    "artist_image_link": "https://images.unsplash.com/photo-1549213783-8284d0336c4f?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=300&q=80",
-    "start_time": "2019-05-21T21:30:00.000Z"
-  }, {
-    "venue_id": 3,
-    "venue_name": "Park Square Live Music & Coffee",
-    "artist_id": 5,
-    "artist_name": "Matt Quevedo",
-    "artist_image_link": "https://images.unsplash.com/photo-1495223153807-b916f75de8c5?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=334&q=80",
-    "start_time": "2019-06-15T23:00:00.000Z"
-  }, {
-    "venue_id": 3,
-    "venue_name": "Park Square Live Music & Coffee",
-    "artist_id": 6,
-    "artist_name": "The Wild Sax Band",
-    "artist_image_link": "https://images.unsplash.com/photo-1558369981-f9ca78462e61?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=794&q=80",
-    "start_time": "2035-04-01T20:00:00.000Z"
-  }, {
-    "venue_id": 3,
-    "venue_name": "Park Square Live Music & Coffee",
-    "artist_id": 6,
-    "artist_name": "The Wild Sax Band",
-    "artist_image_link": "https://images.unsplash.com/photo-1558369981-f9ca78462e61?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=794&q=80",
-    "start_time": "2035-04-08T20:00:00.000Z"
-  }, {
-    "venue_id": 3,
-    "venue_name": "Park Square Live Music & Coffee",
-    "artist_id": 6,
-    "artist_name": "The Wild Sax Band",
-    "artist_image_link": "https://images.unsplash.com/photo-1558369981-f9ca78462e61?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=794&q=80",
-    "start_time": "2035-04-15T20:00:00.000Z"
-  }]
+  rows = db.session.query(Show.start_time, Venue.id, Venue.name, Artist.id, Artist.name, Artist.image_link) \
+    .join(Venue, Venue.id == Show.venue_id) \
+    .join(Artist, Artist.id == Show.artist_id) \
+    .order_by(Show.start_time) \
+    .all()
+
+  data = [{
+    "venue_id": venue_id,
+    "venue_name": venue_name,
+    "artist_id": artist_id,
+    "artist_name": artist_name,
+    "artist_image_link": artist_image_link,
+    "start_time": start_time,
+  } for start_time, venue_id, venue_name, artist_id, artist_name, artist_image_link in rows]
   return render_template('pages/shows.html', shows=data)
 
 @app.route('/shows/create')
@@ -478,15 +633,29 @@ def create_shows():
 @app.route('/shows/create', methods=['POST'])
 def create_show_submission():
   # called to create new shows in the db, upon submitting new show listing form
-  # TODO: insert form data as a new Show record in the db, instead
-
-  # on successful db insert, flash success
-  flash('Show was successfully listed!')
-  # TODO: on unsuccessful db insert, flash an error instead.
-  # e.g., flash('An error occurred. Show could not be listed.')
-  # see: http://flask.pocoo.org/docs/1.0/patterns/flashing/
+  form = ShowForm(request.form)
+  try:
+    show = Show(artist_id=int(form.artist_id.data), venue_id=int(form.venue_id.data), start_time=form.start_time.data)
+    db.session.add(show)
+    db.session.commit()
+    # on successful db insert, flash success
+    flash('Show was successfully listed!')
+  except Exception:
+    db.session.rollback()
+    app.logger.exception('Show could not be listed')
+    flash('An error occurred. Show could not be listed.')
   return render_template('pages/home.html')
 
+#  Metrics
+#  ----------------------------------------------------------------
+
+@app.route('/metrics/requests')
+def request_metrics():
+  # slowest endpoints of the last requests, only when QUERY_PROFILING is enabled
+  if not profiler.enabled:
+    abort(404)
+  return jsonify(endpoints=profiler.report())
+
 @app.errorhandler(404)
 def not_found_error(error):
     return render_template('errors/404.html'), 404
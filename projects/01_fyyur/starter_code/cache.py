@@ -0,0 +1,113 @@
+import secrets
+import time
+from collections import OrderedDict
+from datetime import datetime
+from threading import Lock
+
+
+class MemoryBackend:
+    '''
+    Least recently used entries in process memory, evicted beyond `max_entries`
+    '''
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key):
+        now = time.monotonic()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+
+            value, expires = entry
+            if expires is not None and expires <= now:
+                del self._entries[key]
+                return None
+
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        expires = time.monotonic() + ttl if ttl else None
+
+        with self._lock:
+            self._entries[key] = (value, expires)
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+class RedisBackend:
+    '''
+    Entries shared by all processes through a Redis client (redis.Redis or compatible)
+    '''
+
+    def __init__(self, client, prefix='fyyur:'):
+        self.client = client
+        self.prefix = prefix
+
+    def get(self, key):
+        value = self.client.get(self.prefix + key)
+        return value.decode('utf-8') if isinstance(value, bytes) else value
+
+    def set(self, key, value, ttl=None):
+        self.client.set(self.prefix + key, value, ex=int(ttl) + 1 if ttl else None)
+
+
+class PageCache:
+    '''
+    Rendered pages of venues and artists, keyed by their ID and a version stamp
+
+    bump() gives an entity a new version once its data changed, so the pages
+    rendered before are never read again and age out of the backend. A version
+    missing from the backend (never set or evicted) is replaced by a new one as
+    well, so an old page can never be mistaken for a current one. Pages are kept
+    for at most `ttl` seconds.
+
+    Versions live in the backend next to the pages. With a MemoryBackend a bump()
+    is only seen by the process making it, other processes serve their pages of
+    the old version until they expire; a RedisBackend shares it with all of them.
+    '''
+
+    def __init__(self, backend=None, ttl=300):
+        self.backend = backend if backend is not None else MemoryBackend()
+        self.ttl = ttl
+
+    def version(self, kind, entity_id):
+        key = 'version:{}:{}'.format(kind, entity_id)
+        version = self.backend.get(key)
+        if version is None:
+            version = secrets.token_hex(6)
+            self.backend.set(key, version)
+        return version
+
+    def key(self, kind, entity_id):
+        '''
+        Returns the cache key of the current version of a page, to get() it or to
+        set() it once rendered (read it before querying the data of the page)
+        '''
+        return 'page:{}:{}:{}'.format(kind, entity_id, self.version(kind, entity_id))
+
+    def get(self, key):
+        return self.backend.get(key)
+
+    def set(self, key, page, expires_at=None):
+        '''
+        Stores a rendered page, until `expires_at` (a datetime) if that comes before the ttl
+        '''
+        ttl = self.ttl
+        if expires_at is not None:
+            ttl = min(ttl, max(0.0, (expires_at - datetime.now()).total_seconds()))
+
+        if ttl > 0:
+            self.backend.set(key, page, ttl)
+        return page
+
+    def bump(self, kind, entity_ids):
+        for entity_id in entity_ids:
+            self.backend.set('version:{}:{}'.format(kind, entity_id), secrets.token_hex(6))
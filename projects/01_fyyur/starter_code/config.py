@@ -6,8 +6,17 @@ basedir = os.path.abspath(os.path.dirname(__file__))
 # Enable debug mode.
 DEBUG = True
 
+# Rendered venue and artist pages are cached in process memory (PAGE_CACHE_SIZE pages), where
+# other worker processes see a write only once their copies expire (five minutes at most),
+# or in Redis, shared by all processes, when PAGE_CACHE_REDIS_URL is set (needs the redis package)
+PAGE_CACHE_SIZE = int(os.environ.get('PAGE_CACHE_SIZE', 1024))
+PAGE_CACHE_REDIS_URL = os.environ.get('PAGE_CACHE_REDIS_URL')
+
+# Add Server-Timing headers with the SQL statements of every request
+QUERY_PROFILING = os.environ.get('QUERY_PROFILING', 'false').lower() == 'true'
+
 # Connect to the database
 
 
-# TODO IMPLEMENT DATABASE URL
-SQLALCHEMY_DATABASE_URI = '<Put your local database url>'
+SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL', 'postgresql://localhost:5432/fyyur')
+SQLALCHEMY_TRACK_MODIFICATIONS = False
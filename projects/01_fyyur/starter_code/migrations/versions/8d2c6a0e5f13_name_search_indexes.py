@@ -0,0 +1,61 @@
+"""name search indexes: pg_trgm on Postgres, FTS5 on SQLite
+
+Revision ID: 8d2c6a0e5f13
+Revises: 3b9e4f7a1c25
+Create Date: 2026-10-18 15:02:48.530761
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8d2c6a0e5f13'
+down_revision = '3b9e4f7a1c25'
+branch_labels = None
+depends_on = None
+
+TABLES = ['Venue', 'Artist']
+
+# External content FTS5 tables of the names, kept in sync by triggers
+FTS_DDL = [
+    'CREATE VIRTUAL TABLE "{table}_fts" USING fts5(name, content=\'{table}\', content_rowid=\'id\', tokenize=\'trigram\')',
+    'CREATE TRIGGER "{table}_fts_insert" AFTER INSERT ON "{table}" BEGIN '
+    'INSERT INTO "{table}_fts" (rowid, name) VALUES (new.id, new.name); END',
+    'CREATE TRIGGER "{table}_fts_delete" AFTER DELETE ON "{table}" BEGIN '
+    'INSERT INTO "{table}_fts" ("{table}_fts", rowid, name) VALUES (\'delete\', old.id, old.name); END',
+    'CREATE TRIGGER "{table}_fts_update" AFTER UPDATE OF name ON "{table}" BEGIN '
+    'INSERT INTO "{table}_fts" ("{table}_fts", rowid, name) VALUES (\'delete\', old.id, old.name); '
+    'INSERT INTO "{table}_fts" (rowid, name) VALUES (new.id, new.name); END',
+    'INSERT INTO "{table}_fts" ("{table}_fts") VALUES (\'rebuild\')',
+]
+
+
+def upgrade():
+    dialect = op.get_bind().dialect.name
+
+    if dialect == 'postgresql':
+        op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+
+    for table in TABLES:
+        if dialect == 'postgresql':
+            op.create_index('ix_{}_name_trgm'.format(table), table, ['name'], unique=False,
+                            postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'})
+        else:
+            op.create_index('ix_{}_name_trgm'.format(table), table, ['name'], unique=False)
+
+        if dialect == 'sqlite':
+            for statement in FTS_DDL:
+                op.execute(statement.format(table=table))
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+
+    for table in TABLES:
+        if dialect == 'sqlite':
+            for trigger in ['insert', 'delete', 'update']:
+                op.execute('DROP TRIGGER "{}_fts_{}"'.format(table, trigger))
+            op.execute('DROP TABLE "{}_fts"'.format(table))
+
+        op.drop_index('ix_{}_name_trgm'.format(table), table_name=table)
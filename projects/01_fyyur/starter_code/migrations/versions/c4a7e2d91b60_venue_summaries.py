@@ -0,0 +1,45 @@
+"""venue summaries: venues by area with their number of upcoming shows
+
+Revision ID: c4a7e2d91b60
+Revises: 8d2c6a0e5f13
+Create Date: 2026-10-18 16:11:05.274390
+
+"""
+from datetime import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c4a7e2d91b60'
+down_revision = '8d2c6a0e5f13'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('VenueSummary',
+    sa.Column('venue_id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(), nullable=True),
+    sa.Column('city', sa.String(length=120), nullable=True),
+    sa.Column('state', sa.String(length=120), nullable=True),
+    sa.Column('num_upcoming_shows', sa.Integer(), nullable=False),
+    sa.Column('refresh_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['venue_id'], ['Venue.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('venue_id')
+    )
+    op.create_index('ix_VenueSummary_area', 'VenueSummary', ['state', 'city', 'name'], unique=False)
+
+    # summaries of the existing venues
+    op.get_bind().execute(sa.text(
+        'INSERT INTO "VenueSummary" (venue_id, name, city, state, num_upcoming_shows, refresh_at) '
+        'SELECT "Venue".id, "Venue".name, "Venue".city, "Venue".state, count("Show".id), min("Show".start_time) '
+        'FROM "Venue" LEFT OUTER JOIN "Show" ON "Show".venue_id = "Venue".id AND "Show".start_time > :now '
+        'GROUP BY "Venue".id, "Venue".name, "Venue".city, "Venue".state'
+    ), now=datetime.now())
+
+
+def downgrade():
+    op.drop_index('ix_VenueSummary_area', table_name='VenueSummary')
+    op.drop_table('VenueSummary')
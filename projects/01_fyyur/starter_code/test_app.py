@@ -0,0 +1,151 @@
+import os
+import tempfile
+import threading
+import unittest
+from datetime import datetime, timedelta
+
+# The app connects on import: point it at the test database first
+# (TEST_DATABASE_URL, or a new SQLite file)
+os.environ['DATABASE_URL'] = os.environ.get('TEST_DATABASE_URL') or \
+    'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'fyyur_test.db')
+
+import flask_migrate
+from sqlalchemy.engine.url import make_url
+
+from app import app, db, Venue, Artist, Show, VenueSummary, venue_summaries
+
+
+class VenueSummaryTestCase(unittest.TestCase):
+    """This class represents the venue summary test case"""
+
+    @classmethod
+    def setUpClass(cls):
+        with app.app_context():
+            flask_migrate.upgrade(directory=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations'))
+
+    def setUp(self):
+        self.context = app.app_context()
+        self.context.push()
+
+        self.venue = Venue(name='The Musical Hop', city='San Francisco', state='CA', address='1015 Folsom Street', phone='123-123-1234')
+        self.other_venue = Venue(name='The Dueling Pianos Bar', city='New York', state='NY', address='335 Delancey Street', phone='914-003-1132')
+        self.artist = Artist(name='Guns N Petals', city='San Francisco', state='CA')
+        db.session.add_all([self.venue, self.other_venue, self.artist])
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.rollback()
+        for model in [Show, VenueSummary, Venue, Artist]:
+            db.session.execute(model.__table__.delete())
+        db.session.commit()
+        db.session.remove()
+        self.context.pop()
+
+    def summary(self, venue):
+        db.session.expire_all()
+        return VenueSummary.query.get(venue.id)
+
+    def add_show(self, venue, days):
+        show = Show(venue=venue, artist=self.artist, start_time=datetime.now() + timedelta(days=days))
+        db.session.add(show)
+        db.session.commit()
+        return show
+
+    def test_new_venue_summary(self):
+        summary = self.summary(self.venue)
+
+        self.assertEqual((summary.name, summary.city, summary.state), ('The Musical Hop', 'San Francisco', 'CA'))
+        self.assertEqual(summary.num_upcoming_shows, 0)
+        self.assertIsNone(summary.refresh_at)
+
+    def test_summary_after_add_show(self):
+        self.add_show(self.venue, -1)
+        next_show = self.add_show(self.venue, 2)
+        self.add_show(self.venue, 5)
+
+        summary = self.summary(self.venue)
+        self.assertEqual(summary.num_upcoming_shows, 2)
+        self.assertEqual(summary.refresh_at, next_show.start_time)
+
+    def test_summary_after_move_and_delete_show(self):
+        show = self.add_show(self.venue, 2)
+
+        show.venue = self.other_venue
+        db.session.commit()
+        self.assertEqual(self.summary(self.venue).num_upcoming_shows, 0)
+        self.assertEqual(self.summary(self.other_venue).num_upcoming_shows, 1)
+
+        db.session.delete(show)
+        db.session.commit()
+        self.assertEqual(self.summary(self.other_venue).num_upcoming_shows, 0)
+
+    def test_summary_after_edit_venue(self):
+        self.venue.name = 'The Musical Hop Live'
+        db.session.commit()
+
+        self.assertEqual(self.summary(self.venue).name, 'The Musical Hop Live')
+
+    def test_summary_not_refreshed_after_rollback(self):
+        self.venue.name = 'Never Committed'
+        db.session.flush()
+        db.session.rollback()
+        self.add_show(self.other_venue, 2)
+
+        self.assertEqual(self.summary(self.venue).name, 'The Musical Hop')
+        self.assertEqual(db.session.info.get('written_venues'), None)
+
+    def test_summary_refreshed_once_next_show_started(self):
+        show = self.add_show(self.venue, 2)
+
+        # the show starts: moved to the past without the write hooks seeing it
+        started = datetime.now() - timedelta(minutes=1)
+        db.session.execute(Show.__table__.update().where(Show.__table__.c.id == show.id).values(start_time=started))
+        db.session.execute(VenueSummary.__table__.update().where(VenueSummary.__table__.c.venue_id == self.venue.id).values(refresh_at=started))
+        db.session.commit()
+
+        rows = {row.venue_id: row for row in venue_summaries()}
+        self.assertEqual(rows[self.venue.id].num_upcoming_shows, 0)
+        self.assertIsNone(rows[self.venue.id].refresh_at)
+
+    @unittest.skipUnless(make_url(os.environ['DATABASE_URL']).get_backend_name() == 'postgresql',
+                         'needs concurrent writers (Postgres)')
+    def test_summary_after_concurrent_shows(self):
+        venue_id, artist_id = self.venue.id, self.artist.id
+        barrier = threading.Barrier(4)
+        errors = []
+
+        def add_show():
+            with app.app_context():
+                try:
+                    db.session.add(Show(venue_id=venue_id, artist_id=artist_id, start_time=datetime.now() + timedelta(days=2)))
+                    db.session.flush()
+                    barrier.wait()
+                    db.session.commit()
+                except Exception as error:
+                    errors.append(error)
+                finally:
+                    db.session.remove()
+
+        threads = [threading.Thread(target=add_show) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(self.summary(self.venue).num_upcoming_shows, 4)
+
+    def test_get_venues(self):
+        self.add_show(self.venue, 2)
+
+        res = app.test_client().get('/venues')
+        body = res.data.decode('utf-8')
+
+        self.assertEqual(res.status_code, 200)
+        self.assertIn('The Musical Hop', body)
+        self.assertIn('New York', body)
+
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,94 @@
+'''
+Compares the ORM + format() read path of question lists with the
+format_columns() + format_row() path, on an in-memory SQLite database
+
+Both paths encode with the json module, so `speedup` is the gain of the row
+path alone. When orjson is installed, the row path is also measured encoding
+with orjson (as the JSON and NDJSON question lists do), and `encoder_speedup`
+is the gain of orjson over the json module on that path.
+
+Run from the backend directory:
+    python benchmarks/serialization.py [--rows 10000] [--repeat 5]
+'''
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+
+from models import setup_db, db, db_create_all, Question, Category
+from flaskr import streaming
+
+
+def seed(rows):
+    db.session.add_all([Category(type) for type in ['Science', 'Art', 'Geography', 'History', 'Entertainment', 'Sports']])
+    db.session.commit()
+    Question.bulk_insert({
+        'question': 'Synthetic question number {} about a fairly ordinary topic?'.format(number),
+        'answer': 'Answer {}'.format(number),
+        'category': number % 6 + 1,
+        'difficulty': number % 5 + 1,
+    } for number in range(rows))
+
+
+def orm_format(rows, dumps=json.dumps):
+    questions = [question.format() for question in Question.query.order_by(Question.id).limit(rows)]
+    db.session.expunge_all()
+    return dumps(questions)
+
+
+def row_format(rows, dumps=json.dumps):
+    query = Question.query.with_entities(*Question.format_columns()).order_by(Question.id).limit(rows)
+    return dumps([Question.format_row(row) for row in query])
+
+
+def measure(function, rows, repeat, dumps=json.dumps):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(rows, dumps)
+        timings.append(time.perf_counter() - start)
+        db.session.remove()
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    app = Flask(__name__)
+    setup_db(app, 'sqlite://')
+
+    with app.app_context():
+        db_create_all()
+        seed(args.rows)
+        assert json.loads(orm_format(args.rows)) == json.loads(row_format(args.rows))
+
+        orm = measure(orm_format, args.rows, args.repeat)
+        rows = measure(row_format, args.rows, args.repeat)
+        if streaming.orjson is not None:
+            fast_rows = measure(row_format, args.rows, args.repeat, streaming.dumps)
+
+    result = {
+        'rows': args.rows,
+        'orm_format_ms': round(orm * 1000, 2),
+        'format_row_ms': round(rows * 1000, 2),
+        'speedup': round(orm / rows, 2),
+        'format_row_orjson_ms': None,
+        'encoder_speedup': None,
+    }
+    if streaming.orjson is not None:
+        result['format_row_orjson_ms'] = round(fast_rows * 1000, 2)
+        result['encoder_speedup'] = round(rows / fast_rows, 2)
+
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == '__main__':
+    main()
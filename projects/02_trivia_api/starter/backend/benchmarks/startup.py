@@ -0,0 +1,66 @@
+'''
+Measures the start-up time of create_app() without and with the db.create_all()
+call it used to make on every start, against an existing SQLite database
+
+Run from the backend directory:
+    python benchmarks/startup.py [--repeat 20]
+'''
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+directory = tempfile.mkdtemp()
+os.environ['DATABASE_URL'] = 'sqlite:///{}'.format(os.path.join(directory, 'trivia.db'))
+
+from flaskr import create_app
+from models import db, db_create_all
+
+
+def start(create_all):
+    app = create_app()
+    if create_all:
+        with app.app_context():
+            db_create_all()
+            db.session.remove()
+    return app
+
+
+def measure(create_all, repeat):
+    timings = []
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        app = start(create_all)
+        timings.append(time.perf_counter() - start_time)
+        with app.app_context():
+            db.get_engine().dispose()
+    timings.sort()
+    return timings[len(timings) // 2]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    # the schema exists already, as it does on every start after the first
+    with start(False).app_context():
+        db_create_all()
+
+    fast = measure(False, args.repeat)
+    create_all = measure(True, args.repeat)
+
+    print(json.dumps({
+        'database': os.environ['DATABASE_URL'],
+        'create_app_ms': round(fast * 1000, 2),
+        'create_app_with_create_all_ms': round(create_all * 1000, 2),
+        'saved_ms': round((create_all - fast) * 1000, 2),
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,18 +1,33 @@
+import io
 import os
-from flask import Flask, request, abort, jsonify
+import click
+import flask_migrate
+from flask import Flask, request, abort, jsonify, Response, stream_with_context
 from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy import func
 from flask_cors import CORS
 import random
 
-from models import setup_db, Question, Category
+from models import db, database_path, setup_db, db_create_all, register_cache, pool_stats, Question, Category
+from . import bulk, streaming
+from .cache import ResponseCache
+from . import pagination
+from .pagination import CountCache
+from .profiling import QueryProfiler
+from .search import create_search
+from .quiz import QuestionIndex, QuizSession, MemorySessionStore, new_session_id, ALL_CATEGORIES
 
 QUESTIONS_PER_PAGE = 10
 
 def create_app(test_config=None):
     # create and configure the app
     app = Flask(__name__)
-    setup_db(app)
+
+    if test_config is not None:
+        app.config.from_mapping(test_config)
+
+    setup_db(app, app.config.get('SQLALCHEMY_DATABASE_URI', database_path))
+    profiler = QueryProfiler(app)
 
     '''
     @TODO: Set up CORS. Allow '*' for origins. Delete the sample route after completing the TODOs
@@ -29,20 +44,106 @@ def create_app(test_config=None):
         return response
 
 
-    def paginate(request, collection, count=QUESTIONS_PER_PAGE):
+    # Caches of question data are invalidated by the Question model whenever questions are written
+
+    # Serialized bodies of the category and question list responses
+    response_cache = register_cache(ResponseCache())
+
+    # Totals of paginated queries
+    count_cache = register_cache(CountCache())
+
+    # Question IDs per category for quizzes
+    question_index = register_cache(QuestionIndex())
+
+    # Question search, backed by a trigram index on Postgres (see migrations/) and an in-process index elsewhere
+    question_search = register_cache(create_search(app))
+
+    @app.cli.command('create-db')
+    def create_db():
+        '''
+        Creates the tables of a new, empty database (use `flask db upgrade` for existing ones)
+
+        The database is stamped with the latest revision, so later migrations apply to it.
+        '''
+        if db.engine.has_table(Question.__tablename__):
+            raise click.ClickException('The database already has tables, run `flask db upgrade` instead')
+
+        db_create_all()
+        flask_migrate.stamp()
+
+    @app.cli.command('import-questions')
+    @click.argument('source', type=click.File('r', encoding='utf-8'))
+    @click.option('--format', type=click.Choice(['ndjson', 'csv']), default='ndjson')
+    @click.option('--chunk-size', type=int, default=bulk.CHUNK_SIZE)
+    def import_questions_command(source, format, chunk_size):
+        '''
+        Imports questions from an NDJSON or CSV file
+        '''
+        result = bulk.import_questions(bulk.read_rows(source, format), chunk_size)
+
+        for error in result['errors']:
+            click.echo('Row {row}: {error}'.format(**error), err=True)
+        click.echo('Imported {inserted} questions, rejected {rejected} rows'.format(**result))
+
+    @app.cli.command('export-questions')
+    @click.argument('target', type=click.File('w', encoding='utf-8'))
+    @click.option('--format', type=click.Choice(['ndjson', 'csv']), default='ndjson')
+    def export_questions_command(target, format):
+        '''
+        Exports all questions to an NDJSON or CSV file
+        '''
+        for data in bulk.export_questions(format):
+            target.write(data)
+
+    # Quizzes in progress, any store with get(), set() and delete() can be configured
+    quiz_sessions = app.config.get('QUIZ_SESSION_STORE') or MemorySessionStore()
+
+    def paginate(request, query, count=QUESTIONS_PER_PAGE, keys=None):
         '''
-        This is a helper function to paginate any collection returning a single page of items
+        This is a helper function to paginate any query returning a single page of items,
+        the total number of items matching the query and the cursor of the next page
 
         The function expects:
-        request: the HTTP request to extract the page argument or use a default of 1
-        collection (list): a list of the items to be paginated
+        request: the HTTP request to extract the page or after argument or use a default of page 1
+        query (Query): an ordered SQLAlchemy query of the items to be paginated
         count (int): number of items to be returned per page (currently set to a default of 10)
+        keys (list): the columns the query is ordered by, enables cursor pagination
+
+        Only the requested page is fetched from the database, the total comes from a cached
+        COUNT(*) of the same query. With an `after` cursor the page is selected with a
+        WHERE on the keys instead of an OFFSET, so deep pages cost the same as the first one.
+        An empty `after` argument starts from the first page.
+
+        Raises ValueError if the `after` cursor is malformed or does not match the keys.
         '''
 
-        page = request.args.get('page', default=1, type=int)
-        start = (page-1) * count
-        end = start + count
-        return collection[start:end]
+        total = count_cache.count(query)
+        cursor = request.args.get('after')
+
+        if keys and cursor is not None:
+            if cursor:
+                values = pagination.decode_cursor(cursor, keys)
+                query = query.filter(pagination.after(keys, values))
+
+            items = query.limit(count + 1).all()
+            has_next = len(items) > count
+            items = items[:count]
+
+        else:
+            page = request.args.get('page', default=1, type=int)
+
+            if page < 1:
+                return [], total, None
+
+            start = (page-1) * count
+            items = query.limit(count).offset(start).all()
+            has_next = start + len(items) < total
+
+        next_cursor = None
+        if keys and items and has_next:
+            next_cursor = pagination.encode_cursor(getattr(items[-1], key.key) for key in keys)
+
+        return items, total, next_cursor
 
     '''
     @TODO:
@@ -50,17 +151,13 @@ def create_app(test_config=None):
     for all available categories.
     '''
     @app.route('/categories')
+    @response_cache.cached
     def get_categories():
         '''
         Retreives all available categories
         '''
 
-        categories = Category.query.all()
-
-        if not categories:
-            abort(404)
-
-        paginated_categories = paginate(request, categories)
+        paginated_categories, total_categories, next_cursor = paginate(request, Category.query.order_by(Category.id))
 
         if not paginated_categories:
             abort(404)
@@ -84,26 +181,33 @@ def create_app(test_config=None):
     Clicking on the page numbers should update the questions.
     '''
     @app.route('/questions')
+    @response_cache.cached
     def get_questions():
         '''
         Retrieves all available questions
         '''
 
-        questions = Question.query.all()
-        categories = Category.query.all()
+        questions = Question.query.with_entities(*Question.format_columns()).order_by(Question.id)
 
-        if not questions:
-            abort(404)
+        if streaming.wants_stream(request):
+            return streaming.ndjson_response(Question.format_row(row) for row in streaming.stream(questions))
 
-        paginated_questions = paginate(request, questions)
+        try:
+            paginated_questions, total_questions, next_cursor = paginate(request, questions, keys=[Question.id])
+        except ValueError:
+            # Raise a Bad Request if the after cursor is malformed
+            abort(400)
 
         if not paginated_questions:
             abort(404)
 
-        return jsonify({
+        categories = Category.query.order_by(Category.id).all()
+
+        return streaming.json_response({
             "success": True,
-            "questions": [question.format() for question in paginated_questions],
-            "total_questions": len(questions),
+            "questions": [Question.format_row(row) for row in paginated_questions],
+            "total_questions": total_questions,
+            "next_cursor": next_cursor,
             "current_category": categories[0].id,
             "categories": {category.id: category.type.lower() for category in categories},
         }), 200
@@ -140,6 +244,35 @@ def create_app(test_config=None):
         }), 200
 
 
+    @app.route('/questions', methods=['DELETE'])
+    def delete_questions():
+        '''
+        Deletes a list of questions by their IDs in a single transaction
+        '''
+
+        data = request.json
+        question_ids = data.get('questions') if isinstance(data, dict) else None
+
+        # Raise Bad Request if request body is not a list of question IDs
+        if not question_ids or not isinstance(question_ids, list) \
+                or not all(isinstance(question_id, int) for question_id in question_ids):
+            abort(400)
+
+        try:
+            total_deleted = Question.bulk_delete(set(question_ids))
+
+        except:
+            abort(422)
+
+        if not total_deleted:
+            abort(404)
+
+        return jsonify({
+            "success": True,
+            "total_deleted": total_deleted,
+        }), 200
+
+
     '''
     @TODO:
     Create an endpoint to POST a new question,
@@ -178,6 +311,48 @@ def create_app(test_config=None):
         }), 200
 
 
+    @app.route('/questions/import', methods=['POST'])
+    def import_questions():
+        '''
+        Imports the questions of an NDJSON or CSV (Content-Type: text/csv) request body
+
+        The body is read as a stream and written in chunks, so large question banks
+        can be uploaded in one request. Rows that are invalid or could not be inserted
+        are reported with their line number.
+        '''
+
+        format = 'csv' if request.mimetype == 'text/csv' else 'ndjson'
+        stream = io.TextIOWrapper(request.stream, encoding='utf-8', newline='')
+
+        try:
+            result = bulk.import_questions(bulk.read_rows(stream, format))
+
+        except UnicodeDecodeError:
+            abort(400)
+
+        return jsonify({
+            "success": True,
+            "inserted": result['inserted'],
+            "rejected": result['rejected'],
+            "errors": result['errors'],
+        }), 200
+
+    @app.route('/questions/export')
+    def export_questions():
+        '''
+        Streams all questions as NDJSON, or as CSV with ?format=csv
+        '''
+
+        format = request.args.get('format', 'ndjson')
+
+        if format not in ['ndjson', 'csv']:
+            abort(400)
+
+        mimetype = 'text/csv' if format == 'csv' else 'application/x-ndjson'
+
+        return Response(stream_with_context(bulk.export_questions(format)), mimetype=mimetype)
+
+
     '''
     @TODO:
     Create a POST endpoint to get questions based on a search term.
@@ -195,25 +370,32 @@ def create_app(test_config=None):
         '''
 
         data = request.json
+        search_term = data.get('searchTerm') if isinstance(data, dict) else None
 
-        try:
-            search_term = data['searchTerm']
-
-        except KeyError:
-            # Raise a Bad Request if searchTerm is not in request body
+        if not isinstance(search_term, str):
+            # Raise a Bad Request if searchTerm is not a string in request body
             abort(400)
 
         try:
-            questions = Question.query.filter(Question.question.ilike('%{}%'.format(search_term))).all()
-            paginated_questions = paginate(request, questions)
+            questions, keys = question_search.query(search_term)
+
+            if streaming.wants_stream(request):
+                return streaming.ndjson_response(Question.format_row(row) for row in streaming.stream(questions))
+
+            paginated_questions, total_questions, next_cursor = paginate(request, questions, keys=keys)
+
+        except ValueError:
+            # Raise a Bad Request if the after cursor is malformed
+            abort(400)
 
         except:
             abort(422)
 
-        return jsonify({
+        return streaming.json_response({
             "success": True,
-            "questions": [question.format() for question in paginated_questions],
-            "total_questions": len(questions),
+            "questions": [Question.format_row(row) for row in paginated_questions],
+            "total_questions": total_questions,
+            "next_cursor": next_cursor,
         }), 200
 
 
@@ -226,25 +408,32 @@ def create_app(test_config=None):
     category to be shown.
     '''
     @app.route('/categories/<int:category_id>/questions')
+    @response_cache.cached
     def get_questions_by_category(category_id):
         '''
         Retrieves questions based on the selected category
         '''
 
-        questions = Question.query.filter_by(category=category_id).all()
+        questions = Question.query.with_entities(*Question.format_columns()) \
+            .filter_by(category=category_id).order_by(Question.id)
 
-        if not questions:
-            abort(404)
+        if streaming.wants_stream(request):
+            return streaming.ndjson_response(Question.format_row(row) for row in streaming.stream(questions))
 
-        paginated_questions = paginate(request, questions)
+        try:
+            paginated_questions, total_questions, next_cursor = paginate(request, questions, keys=[Question.id])
+        except ValueError:
+            # Raise a Bad Request if the after cursor is malformed
+            abort(400)
 
         if not paginated_questions:
             abort(404)
 
-        return jsonify({
+        return streaming.json_response({
             "success": True,
-            "questions": [question.format() for question in paginated_questions],
-            "total_questions": len(questions),
+            "questions": [Question.format_row(row) for row in paginated_questions],
+            "total_questions": total_questions,
+            "next_cursor": next_cursor,
             "current_category": category_id,
         }), 200
 
@@ -276,15 +465,11 @@ def create_app(test_config=None):
         quiz_category = data.get('quiz_category')
 
         try:
-            # Filter out all previously used questions
-            possible_questions = Question.query.filter(Question.id.notin_(previous_questions))
+            # Questions of all categories are drawn if ALL categories is selected
+            category_id = int(quiz_category.get('id') or ALL_CATEGORIES)
 
-            # Filter only questions from the selected category if not ALL categories is selected
-            if quiz_category.get('id') != 0:
-                possible_questions = possible_questions.filter(Question.category == quiz_category['id'])
-
-            # Randomize the returned question to allow for variation in quizzes
-            next_question = possible_questions.order_by(func.random()).first()
+            # Draw a random question that was not used yet from the in-process index
+            next_question = question_index.draw_question(category_id, exclude=previous_questions)
 
             next_question = next_question.format() if next_question else None
 
@@ -297,6 +482,117 @@ def create_app(test_config=None):
             "question": next_question,
         }), 200
 
+    @app.route('/quizzes', methods=['POST'])
+    def create_quiz():
+        '''
+        Starts a quiz session holding the order of its questions on the server
+
+        Playing the quiz with /quizzes/<quiz_id>/next only needs the quiz ID, so the
+        request size and the cost of every turn do not grow with the number of
+        questions already played.
+        '''
+
+        data = request.json
+
+        # Raise Bad Request if request body is missing the required data
+        if not data or 'quiz_category' not in data:
+            abort(400)
+
+        quiz_category = data.get('quiz_category')
+
+        try:
+            # Questions of all categories are played if ALL categories is selected
+            category_id = int(quiz_category.get('id') or ALL_CATEGORIES)
+
+            quiz = QuizSession(category_id, question_index.ids(category_id))
+            quiz_id = new_session_id()
+            quiz_sessions.set(quiz_id, quiz)
+
+        except:
+            abort(422)
+
+        return jsonify({
+            "success": True,
+            "quiz_id": quiz_id,
+            "total_questions": quiz.remaining,
+        }), 200
+
+    @app.route('/quizzes/<quiz_id>/next', methods=['POST'])
+    def next_quiz_question(quiz_id):
+        '''
+        Retrieves the next question of a quiz session
+        '''
+
+        quiz = quiz_sessions.get(quiz_id)
+
+        if quiz is None:
+            abort(404)
+
+        try:
+            next_question = None
+
+            while next_question is None:
+                question_id = quiz.pop()
+                if question_id is None:
+                    break
+
+                # Questions deleted since the quiz started are skipped
+                next_question = Question.query.get(question_id)
+
+            quiz_sessions.set(quiz_id, quiz)
+
+            next_question = next_question.format() if next_question else None
+
+        except:
+            abort(422)
+
+        return jsonify({
+            "success": True,
+            "question": next_question,
+            "remaining_questions": quiz.remaining,
+        }), 200
+
+    @app.route('/quizzes/<quiz_id>', methods=['DELETE'])
+    def end_quiz(quiz_id):
+        '''
+        Ends a quiz session
+        '''
+
+        if quiz_sessions.get(quiz_id) is None:
+            abort(404)
+
+        quiz_sessions.delete(quiz_id)
+
+        return jsonify({
+            "success": True,
+            "quiz_id": quiz_id,
+        }), 200
+
+    @app.route('/metrics/db')
+    def get_db_metrics():
+        '''
+        Retrieves live statistics of the database connection pool
+        '''
+
+        return jsonify({
+            "success": True,
+            "pool": pool_stats(),
+        }), 200
+
+    @app.route('/metrics/requests')
+    def get_request_metrics():
+        '''
+        Retrieves the slowest endpoints of the last requests, if query profiling is enabled
+        '''
+
+        if not profiler.enabled:
+            abort(404)
+
+        return jsonify({
+            "success": True,
+            "endpoints": profiler.report(),
+        }), 200
+
     '''
     @TODO:
     Create error handlers for all expected errors
@@ -0,0 +1,166 @@
+import csv
+import io
+import json
+
+from models import db, batch, Question, Category
+from . import streaming
+
+# Number of rows validated and written per transaction
+CHUNK_SIZE = 1000
+
+# Number of row errors reported back, the rest is only counted
+MAX_REPORTED_ERRORS = 1000
+
+FIELDS = ['question', 'answer', 'category', 'difficulty']
+
+
+def read_rows(stream, format='ndjson'):
+    '''
+    Yields the line number and the parsed object of every row of a text stream
+
+    NDJSON streams hold one JSON object per line, CSV streams start with a header
+    line naming the columns. Rows that cannot be parsed are yielded as None.
+    '''
+    if format == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+        return
+
+    for line_number, line in enumerate(stream, start=1):
+        if not line.strip():
+            continue
+
+        try:
+            yield line_number, json.loads(line)
+        except ValueError:
+            yield line_number, None
+
+
+def validate(row, category_ids):
+    '''
+    Returns the column values of a row and None, or None and the reason the row is invalid
+    '''
+    if not isinstance(row, dict):
+        return None, 'Malformed row'
+
+    missing = [field for field in FIELDS if not row.get(field)]
+    if missing:
+        return None, 'Missing {}'.format(', '.join(missing))
+
+    try:
+        category = int(row['category'])
+        difficulty = int(row['difficulty'])
+    except (TypeError, ValueError):
+        return None, 'Category and difficulty must be integers'
+
+    if category not in category_ids:
+        return None, 'Unknown category {}'.format(category)
+
+    return {
+        'question': str(row['question']),
+        'answer': str(row['answer']),
+        'category': category,
+        'difficulty': difficulty,
+    }, None
+
+
+def write_chunk(values):
+    '''
+    Inserts validated rows within the current transaction
+
+    Postgres receives the rows with a single COPY, other databases with one
+    executemany INSERT (Question.bulk_insert()).
+    '''
+    if db.engine.dialect.name == 'postgresql':
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for row in values:
+            writer.writerow([row[field] for field in FIELDS])
+        buffer.seek(0)
+
+        cursor = db.session.connection().connection.cursor()
+        cursor.copy_expert('COPY questions (question, answer, category, difficulty) FROM STDIN WITH (FORMAT csv)', buffer)
+        return
+
+    Question.bulk_insert(values)
+
+
+def import_questions(rows, chunk_size=CHUNK_SIZE):
+    '''
+    Imports questions from (line number, row) pairs as read by read_rows()
+
+    Rows are validated and written in chunks of `chunk_size`, every chunk is
+    committed on its own so memory use stays flat and a failing chunk does not
+    undo the chunks before it. The rows of a chunk the database rejects are
+    retried one by one, so only the faulty rows are rejected. Returns the number of imported questions, the
+    number of rejected rows and the errors of the first rejected rows.
+    '''
+    category_ids = {category_id for category_id, in Category.query.with_entities(Category.id)}
+    result = {'inserted': 0, 'rejected': 0, 'errors': []}
+
+    def reject(line_number, error):
+        result['rejected'] += 1
+        if len(result['errors']) < MAX_REPORTED_ERRORS:
+            result['errors'].append({'row': line_number, 'error': error})
+
+    def write(chunk):
+        with batch():
+            write_chunk([values for line_number, values in chunk])
+        result['inserted'] += len(chunk)
+
+    def flush(chunk):
+        try:
+            write(chunk)
+        except Exception:
+            # The database rejected a row of the chunk: write the rows one by one
+            # to insert the others and find out which rows were rejected, and why
+            for line_number, values in chunk:
+                try:
+                    write([(line_number, values)])
+                except Exception as error:
+                    # the message of the database driver, without the statement
+                    reject(line_number, 'Not inserted: {}'.format(getattr(error, 'orig', None) or error))
+
+    chunk = []
+    for line_number, row in rows:
+        values, error = validate(row, category_ids)
+        if error:
+            reject(line_number, error)
+            continue
+
+        chunk.append((line_number, values))
+        if len(chunk) >= chunk_size:
+            flush(chunk)
+            chunk = []
+
+    if chunk:
+        flush(chunk)
+
+    return result
+
+
+def export_questions(format='ndjson', chunk_size=CHUNK_SIZE):
+    '''
+    Yields all questions as NDJSON lines or CSV lines, reading the table in chunks
+    of `chunk_size` rows through a server-side cursor where the database supports it
+    '''
+    columns = Question.format_columns()
+    query = streaming.stream(Question.query.with_entities(*columns).order_by(Question.id), chunk_size)
+
+    if format == 'csv':
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow([column.key for column in columns])
+
+        for row in query:
+            writer.writerow(row)
+            if buffer.tell() > 65536:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+
+        yield buffer.getvalue()
+        return
+
+    yield from streaming.ndjson((Question.format_row(row) for row in query), chunk_size)
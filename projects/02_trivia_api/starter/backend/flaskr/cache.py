@@ -0,0 +1,90 @@
+import hashlib
+import time
+from collections import OrderedDict
+from functools import wraps
+from threading import Lock
+
+from flask import request, Response
+
+
+class ResponseCache:
+    '''
+    Caches the serialized JSON bodies of read-mostly GET endpoints
+
+    Successful responses are kept per path, query string and Accept header for
+    `ttl` seconds, or until invalidate() is called after questions were written;
+    the least recently used entries are evicted beyond `max_entries`. Every cached
+    body carries an ETag, so a client repeating a request with If-None-Match gets
+    a 304 without the view (or the database) being touched.
+    '''
+
+    def __init__(self, ttl=60, max_entries=1024):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key):
+        now = time.monotonic()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+
+            if entry[2] <= now:
+                del self._entries[key]
+                return None
+
+            self._entries.move_to_end(key)
+            return entry[0], entry[1]
+
+    def set(self, key, body):
+        etag = hashlib.sha1(body).hexdigest()
+
+        with self._lock:
+            self._entries[key] = (body, etag, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+        return etag
+
+    def invalidate(self):
+        with self._lock:
+            self._entries.clear()
+
+    def cached(self, view):
+        '''
+        Decorator serving a view from the cache
+        '''
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            key = request.full_path, request.headers.get('Accept', '')
+            entry = self.get(key)
+
+            if entry is None:
+                response = view(*args, **kwargs)
+                if isinstance(response, tuple):
+                    response, status = response
+                    response.status_code = status
+
+                if response.status_code != 200 or response.is_streamed:
+                    return response
+
+                body = response.get_data()
+                etag = self.set(key, body)
+            else:
+                body, etag = entry
+
+            if request.if_none_match.contains(etag):
+                response = Response(status=304)
+            else:
+                response = Response(body, mimetype='application/json')
+
+            response.set_etag(etag)
+            response.vary.add('Accept')
+            return response
+
+        return wrapper
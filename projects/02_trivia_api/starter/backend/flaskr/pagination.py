@@ -0,0 +1,116 @@
+import base64
+import json
+import time
+from collections import OrderedDict
+from threading import Lock
+
+from sqlalchemy import tuple_
+
+
+class CountCache:
+    '''
+    Caches the COUNT(*) of paginated queries
+
+    Every page of a listing needs the total number of matching rows, but the total
+    only changes when questions are added or removed. Counts are kept per query
+    (SQL text and bound parameters) for `ttl` seconds, or until invalidate() is called
+    after a write; the least recently used counts are evicted beyond `max_entries`,
+    and expired ones whenever a new count is stored.
+    '''
+
+    def __init__(self, ttl=60, max_entries=1024):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._counts = OrderedDict()
+        self._lock = Lock()
+
+    @staticmethod
+    def key(query):
+        statement = query.statement.compile()
+        return str(statement), tuple(sorted(statement.params.items()))
+
+    def count(self, query):
+        key = self.key(query)
+        now = time.monotonic()
+
+        with self._lock:
+            cached = self._counts.get(key)
+            if cached is not None and cached[1] > now:
+                self._counts.move_to_end(key)
+                return cached[0]
+
+        total = query.order_by(None).count()
+
+        with self._lock:
+            for stale in [cached for cached, (_, expires) in self._counts.items() if expires <= now]:
+                del self._counts[stale]
+
+            self._counts[key] = (total, now + self.ttl)
+            self._counts.move_to_end(key)
+
+            while len(self._counts) > self.max_entries:
+                self._counts.popitem(last=False)
+
+        return total
+
+    def invalidate(self):
+        with self._lock:
+            self._counts.clear()
+
+
+def encode_cursor(values):
+    '''
+    Encodes the sort key values of the last item of a page as an opaque cursor
+    '''
+    raw = json.dumps(list(values), separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def matches_type(key, value):
+    '''
+    Whether a cursor value can be compared with the column `key`: a scalar of its Python type
+    '''
+    if isinstance(value, bool) or not isinstance(value, (str, int, float)):
+        return False
+
+    try:
+        python_type = key.type.python_type
+    except NotImplementedError:
+        return True
+
+    if python_type is float:
+        return isinstance(value, (int, float))
+
+    return isinstance(value, python_type)
+
+
+def decode_cursor(cursor, keys):
+    '''
+    Decodes a cursor created by encode_cursor() for a query ordered by `keys`
+
+    Raises ValueError if the cursor is malformed, does not hold one value per key
+    or holds a value of another type than its key column.
+    '''
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        values = json.loads(raw.decode('utf-8'))
+    except (TypeError, ValueError):
+        raise ValueError('Malformed cursor')
+
+    if not isinstance(values, list) or len(values) != len(keys):
+        raise ValueError('Malformed cursor')
+
+    if not all(matches_type(key, value) for key, value in zip(keys, values)):
+        raise ValueError('Malformed cursor')
+
+    return values
+
+
+def after(keys, values):
+    '''
+    Returns the filter selecting the rows that sort after `values` on `keys`
+    '''
+    if len(keys) == 1:
+        return keys[0] > values[0]
+
+    return tuple_(*keys) > tuple_(*values)
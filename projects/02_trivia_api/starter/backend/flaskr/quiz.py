@@ -0,0 +1,193 @@
+import random
+import secrets
+import time
+from array import array
+from collections import OrderedDict
+from threading import Lock
+
+from models import Question
+
+# Key of the index entry holding the questions of every category
+ALL_CATEGORIES = 0
+
+
+class QuestionIndex:
+    '''
+    In-process index of question IDs per category for drawing quiz questions
+
+    The IDs of every category are kept in flat arrays, so drawing a random question
+    is a random array lookup plus a primary key fetch instead of an ORDER BY random()
+    over the whole table. The index is rebuilt lazily after invalidate() is called
+    (when questions are inserted or deleted) or once it is `ttl` seconds old, which
+    picks up writes made by other worker processes.
+    '''
+
+    # Number of random picks tried before falling back to scanning the category
+    MAX_ATTEMPTS = 16
+
+    def __init__(self, ttl=300):
+        self.ttl = ttl
+        self._ids = {}
+        self._expires = 0
+        self._lock = Lock()
+
+    def invalidate(self):
+        self._expires = 0
+
+    def _rebuild(self):
+        ids = {ALL_CATEGORIES: array('l')}
+
+        for question_id, category in Question.query.with_entities(Question.id, Question.category).order_by(Question.id):
+            ids[ALL_CATEGORIES].append(question_id)
+            if category is not None:
+                ids.setdefault(int(category), array('l')).append(question_id)
+
+        self._ids = ids
+        self._expires = time.monotonic() + self.ttl
+
+    def ids(self, category):
+        '''
+        Returns the array of question IDs in a category, rebuilding the index if needed
+        '''
+        if self._expires <= time.monotonic():
+            with self._lock:
+                if self._expires <= time.monotonic():
+                    self._rebuild()
+
+        return self._ids.get(category, array('l'))
+
+    def draw(self, category, exclude=()):
+        '''
+        Returns a random question ID of a category that is not in `exclude`, or None
+
+        Random picks are rejected while they hit an excluded ID, which takes constant
+        time on average as long as most of the category has not been played yet. Near
+        the end of a quiz the remaining IDs are collected instead.
+        '''
+        ids = self.ids(category)
+        exclude = set(exclude)
+
+        if len(exclude) < len(ids):
+            for _ in range(self.MAX_ATTEMPTS):
+                question_id = ids[random.randrange(len(ids))]
+                if question_id not in exclude:
+                    return question_id
+
+        remaining = [question_id for question_id in ids if question_id not in exclude]
+        return random.choice(remaining) if remaining else None
+
+    def draw_question(self, category, exclude=()):
+        '''
+        Returns a random Question of a category that is not in `exclude`, or None
+        '''
+        exclude = set(exclude)
+
+        while True:
+            question_id = self.draw(category, exclude)
+            if question_id is None:
+                return None
+
+            question = Question.query.get(question_id)
+            if question is not None:
+                return question
+
+            # Deleted by another worker since the index was built
+            self.invalidate()
+            exclude.add(question_id)
+
+
+class QuizSession:
+    '''
+    A quiz in progress: the question IDs of its category in a lazily shuffled order
+
+    Every pop() finishes one more step of a Fisher-Yates shuffle, so a turn takes
+    constant time and creating the session only copies the ID array. pop() holds
+    the lock of the session, so concurrent turns of one quiz never get the same
+    question.
+    '''
+
+    def __init__(self, category, ids):
+        self.category = category
+        self.ids = array('l', ids)
+        self.position = 0
+        self._lock = Lock()
+
+    def __getstate__(self):
+        # Stores serializing sessions (e.g. with pickle) do not keep the lock
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = Lock()
+
+    @property
+    def remaining(self):
+        return len(self.ids) - self.position
+
+    def pop(self):
+        '''
+        Returns the next question ID of the quiz, or None once all were played
+        '''
+        with self._lock:
+            if not self.remaining:
+                return None
+
+            ids = self.ids
+            position = self.position
+            swap = random.randrange(position, len(ids))
+            ids[position], ids[swap] = ids[swap], ids[position]
+            self.position += 1
+            return ids[position]
+
+
+class MemorySessionStore:
+    '''
+    Keeps quiz sessions in process memory
+
+    Sessions expire `ttl` seconds after their last use and the least recently used
+    sessions are evicted beyond `max_sessions`. Any object with the same get(),
+    set() and delete() methods can be used instead, e.g. to share sessions between
+    worker processes.
+    '''
+
+    def __init__(self, ttl=3600, max_sessions=10000):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self._sessions = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, session_id):
+        now = time.monotonic()
+
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                return None
+
+            session, expires = entry
+            if expires <= now:
+                del self._sessions[session_id]
+                return None
+
+            self._sessions.move_to_end(session_id)
+            return session
+
+    def set(self, session_id, session):
+        now = time.monotonic()
+
+        with self._lock:
+            self._sessions[session_id] = (session, now + self.ttl)
+            self._sessions.move_to_end(session_id)
+
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+
+    def delete(self, session_id):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+
+def new_session_id():
+    return secrets.token_urlsafe(16)
@@ -0,0 +1,162 @@
+import re
+import time
+from array import array
+from threading import Lock
+
+from sqlalchemy import func, Integer
+from sqlalchemy.engine.url import make_url
+
+from models import Question
+
+# Above this many candidates the inverted index no longer narrows the search usefully
+MAX_CANDIDATES = 500
+
+TOKEN = re.compile(r'\w+')
+
+
+def tokenize(text):
+    return TOKEN.findall(text.lower()) if text else []
+
+
+def contains(term):
+    '''
+    Returns the case-insensitive substring filter of a search term
+    '''
+    escaped = term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return Question.question.ilike('%{}%'.format(escaped), escape='\\')
+
+
+class QuestionSearch:
+    '''
+    Case-insensitive substring search over the question texts
+
+    Results are ranked by the position of the first match (questions starting with
+    the term come first), then by ID. Ranking, filtering and pagination all happen
+    in the database.
+    '''
+
+    def invalidate(self):
+        pass
+
+    def rank(self, term):
+        return func.instr(func.lower(Question.question), term.lower(), type_=Integer).label('search_rank')
+
+    def query(self, term):
+        '''
+        Returns the ranked query of the questions matching a term and its sort keys
+        '''
+        rank = self.rank(term)
+        query = Question.query.with_entities(*Question.format_columns(), rank).filter(contains(term))
+        return query.order_by(rank, Question.id), [rank, Question.id]
+
+
+class TrigramSearch(QuestionSearch):
+    '''
+    Question search for Postgres, backed by a pg_trgm GIN index
+
+    The index (created by the question_trigram_index migration) serves the
+    ILIKE '%term%' filter, so the search keeps its substring semantics without a
+    sequential scan.
+    '''
+
+    def rank(self, term):
+        return func.strpos(func.lower(Question.question), term.lower(), type_=Integer).label('search_rank')
+
+
+class InvertedIndexSearch(QuestionSearch):
+    '''
+    Question search for databases without pg_trgm (e.g. SQLite)
+
+    An in-process inverted index maps every word of the question texts to the IDs of
+    the questions using it, and every substring of up to GRAM characters of those
+    words to the words containing it. The words containing a word of the term are
+    looked up by its rarest trigram (or directly, for shorter words), which narrows
+    the database query to a primary key lookup of the candidates before the
+    substring filter is applied. The index is rebuilt lazily after invalidate() is
+    called or once it is `ttl` seconds old.
+    '''
+
+    # Length of the longest substrings of words that are indexed
+    GRAM = 3
+
+    def __init__(self, ttl=300):
+        self.ttl = ttl
+        self._index = {}, {}
+        self._expires = 0
+        self._lock = Lock()
+
+    def invalidate(self):
+        self._expires = 0
+
+    def _rebuild(self):
+        postings = {}
+
+        for question_id, text in Question.query.with_entities(Question.id, Question.question).order_by(Question.id):
+            for word in set(tokenize(text)):
+                postings.setdefault(word, array('l')).append(question_id)
+
+        grams = {}
+        for word in postings:
+            for gram in self.grams(word):
+                grams.setdefault(gram, []).append(word)
+
+        self._index = postings, grams
+        self._expires = time.monotonic() + self.ttl
+
+    @classmethod
+    def grams(cls, word):
+        return {word[start:start + size] for size in range(1, cls.GRAM + 1) for start in range(len(word) - size + 1)}
+
+    def words_containing(self, token, grams):
+        if len(token) <= self.GRAM:
+            return grams.get(token, ())
+
+        trigrams = [token[start:start + self.GRAM] for start in range(len(token) - self.GRAM + 1)]
+        rarest = min((grams.get(trigram, ()) for trigram in trigrams), key=len)
+        return [word for word in rarest if token in word]
+
+    def candidates(self, term):
+        '''
+        Returns the IDs of the questions that may contain a term, or None if the
+        index cannot narrow the search
+        '''
+        if self._expires <= time.monotonic():
+            with self._lock:
+                if self._expires <= time.monotonic():
+                    self._rebuild()
+
+        postings, grams = self._index
+        candidates = None
+
+        for token in set(tokenize(term)):
+            matches = set()
+            for word in self.words_containing(token, grams):
+                matches.update(postings[word])
+
+            candidates = matches if candidates is None else candidates & matches
+            if not candidates:
+                break
+
+        if candidates is not None and len(candidates) > MAX_CANDIDATES:
+            return None
+
+        return candidates
+
+    def query(self, term):
+        query, keys = super().query(term)
+        candidates = self.candidates(term)
+
+        if candidates is not None:
+            query = query.filter(Question.id.in_(sorted(candidates)))
+
+        return query, keys
+
+
+def create_search(app):
+    '''
+    Returns the question search backend for the database of an app
+    '''
+    if make_url(app.config['SQLALCHEMY_DATABASE_URI']).get_backend_name() in ('postgres', 'postgresql'):
+        return TrigramSearch()
+
+    return InvertedIndexSearch()
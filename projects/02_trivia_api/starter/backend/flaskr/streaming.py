@@ -0,0 +1,76 @@
+import json
+
+from flask import jsonify, Response, stream_with_context
+
+try:
+    # Optional, serializes several times faster than the json module
+    import orjson
+except ImportError:
+    orjson = None
+
+NDJSON = 'application/x-ndjson'
+
+# Number of rows fetched from the server-side cursor and written to the response at once
+CHUNK_SIZE = 1000
+
+
+def wants_stream(request):
+    '''
+    Tells if a request asked for a streamed NDJSON response, with ?format=ndjson
+    or an Accept: application/x-ndjson header
+    '''
+    if request.args.get('format') == 'ndjson':
+        return True
+
+    return request.accept_mimetypes.best_match(['application/json', NDJSON]) == NDJSON
+
+
+def stream(query, chunk_size=CHUNK_SIZE):
+    '''
+    Iterates over the results of a query, fetching `chunk_size` rows at a time
+    through a server-side cursor where the database supports it
+    '''
+    return query.execution_options(stream_results=True).yield_per(chunk_size)
+
+
+def dumps(obj):
+    '''
+    Serializes an object to JSON, with orjson when it is installed
+    '''
+    if orjson is not None:
+        return orjson.dumps(obj).decode('utf-8')
+
+    return json.dumps(obj)
+
+
+def ndjson(objects, chunk_size=CHUNK_SIZE):
+    '''
+    Serializes objects as NDJSON lines, yielding them `chunk_size` lines at a time
+    '''
+    lines = []
+    for obj in objects:
+        lines.append(dumps(obj) + '\n')
+        if len(lines) >= chunk_size:
+            yield ''.join(lines)
+            lines = []
+
+    if lines:
+        yield ''.join(lines)
+
+
+def ndjson_response(objects):
+    '''
+    Returns a response streaming objects as NDJSON while they are read from the database
+    '''
+    return Response(stream_with_context(ndjson(objects)), mimetype=NDJSON)
+
+
+def json_response(obj):
+    '''
+    Returns a JSON response, encoded with orjson when it is installed and with
+    jsonify() otherwise
+    '''
+    if orjson is None:
+        return jsonify(obj)
+
+    return Response(orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS), mimetype='application/json')
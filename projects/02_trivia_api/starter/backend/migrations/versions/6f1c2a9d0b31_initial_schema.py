@@ -0,0 +1,44 @@
+"""initial schema, as loaded from trivia.psql
+
+Revision ID: 6f1c2a9d0b31
+Revises: 
+Create Date: 2026-10-18 10:02:11.402518
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '6f1c2a9d0b31'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Databases restored from trivia.psql already have both tables
+    tables = sa.inspect(op.get_bind()).get_table_names()
+
+    if 'categories' not in tables:
+        op.create_table('categories',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('type', sa.String(), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+        )
+
+    if 'questions' not in tables:
+        op.create_table('questions',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('question', sa.String(), nullable=True),
+        sa.Column('answer', sa.String(), nullable=True),
+        sa.Column('difficulty', sa.Integer(), nullable=True),
+        sa.Column('category', sa.Integer(), nullable=True),
+        sa.ForeignKeyConstraint(['category'], ['categories.id'], name='category', onupdate='CASCADE', ondelete='SET NULL'),
+        sa.PrimaryKeyConstraint('id')
+        )
+
+
+def downgrade():
+    op.drop_table('questions')
+    op.drop_table('categories')
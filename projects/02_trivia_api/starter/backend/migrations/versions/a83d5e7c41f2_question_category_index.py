@@ -0,0 +1,46 @@
+"""integer category foreign key and (category, id) index on questions
+
+Revision ID: a83d5e7c41f2
+Revises: 6f1c2a9d0b31
+Create Date: 2026-10-18 10:14:37.118204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a83d5e7c41f2'
+down_revision = '6f1c2a9d0b31'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    category = [column for column in inspector.get_columns('questions') if column['name'] == 'category'][0]
+
+    # Tables created by db.create_all() before this revision store categories as strings
+    if not isinstance(category['type'], sa.Integer):
+        with op.batch_alter_table('questions') as batch_op:
+            batch_op.alter_column('category', type_=sa.Integer(), existing_type=category['type'],
+                                  postgresql_using='category::integer')
+
+    if not inspector.get_foreign_keys('questions'):
+        with op.batch_alter_table('questions') as batch_op:
+            batch_op.create_foreign_key('category', 'categories', ['category'], ['id'],
+                                        onupdate='CASCADE', ondelete='SET NULL')
+
+    # Serves the category filters (leading column) as well as their ORDER BY id
+    op.create_index('ix_questions_category_id', 'questions', ['category', 'id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_questions_category_id', table_name='questions')
+
+    # Back to the schema of the tables created by db.create_all() before this revision
+    # (string categories without a foreign key), whatever the database started from
+    with op.batch_alter_table('questions') as batch_op:
+        batch_op.drop_constraint('category', type_='foreignkey')
+        batch_op.alter_column('category', type_=sa.String(), existing_type=sa.Integer(),
+                              postgresql_using='category::text')
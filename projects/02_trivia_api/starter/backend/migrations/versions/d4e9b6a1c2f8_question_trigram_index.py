@@ -0,0 +1,31 @@
+"""pg_trgm index on the question texts, serving the question search on Postgres (a plain index elsewhere)
+
+Revision ID: d4e9b6a1c2f8
+Revises: a83d5e7c41f2
+Create Date: 2026-10-18 16:02:51.407316
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd4e9b6a1c2f8'
+down_revision = 'a83d5e7c41f2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        # IF NOT EXISTS: databases set up before this revision may have the index already
+        op.execute('CREATE INDEX IF NOT EXISTS questions_question_trgm_idx ON questions USING gin (question gin_trgm_ops)')
+    else:
+        # Other databases are searched through the in-process index of flaskr/search.py,
+        # the index is a plain one there, as declared on the model
+        op.create_index('questions_question_trgm_idx', 'questions', ['question'], unique=False)
+
+
+def downgrade():
+    op.drop_index('questions_question_trgm_idx', table_name='questions')
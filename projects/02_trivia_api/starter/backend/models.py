@@ -1,29 +1,174 @@
 import os
-from sqlalchemy import Column, String, Integer, create_engine
+import time
+from contextlib import contextmanager
+from weakref import WeakSet
+from sqlalchemy import Column, String, Integer, ForeignKey, Index, DDL, create_engine, event
 from flask_sqlalchemy import SQLAlchemy
+from flask_migrate import Migrate
+from sqlalchemy.pool import QueuePool
 import json
 
 db_user = os.environ.get('DB_USER')
 db_password = os.environ.get('DB_PASS')
-database_name = "trivia"
-database_path = "postgres://{}:{}@{}/{}".format(db_user, db_password, 'localhost:5432', database_name)
+database_name = os.environ.get('DB_NAME', "trivia")
+database_path = os.environ.get('DATABASE_URL', "postgres://{}:{}@{}/{}".format(db_user, db_password, 'localhost:5432', database_name))
 
 db = SQLAlchemy()
+migrate = Migrate()
+
+# The schema migrations, found wherever the flask command is run from
+migrations_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations')
 
 secret_key = os.environ.get('SECRET_KEY')
 
+'''
+TimedQueuePool
+    connection pool keeping track of how long checkouts wait for a connection
+'''
+class TimedQueuePool(QueuePool):
+  def __init__(self, *args, **kwargs):
+    super().__init__(*args, **kwargs)
+    self.checkouts = 0
+    self.wait_time = 0.0
+    self.max_wait_time = 0.0
+
+  def _do_get(self):
+    start = time.perf_counter()
+    try:
+      return super()._do_get()
+    finally:
+      waited = time.perf_counter() - start
+      self.checkouts += 1
+      self.wait_time += waited
+      self.max_wait_time = max(self.max_wait_time, waited)
+
+'''
+engine_options(database_path)
+    connection pool options, configurable with environment variables:
+    DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT (seconds), DB_POOL_RECYCLE (seconds)
+    and DB_POOL_PRE_PING (true/false)
+    the pool is only sized for server databases, SQLite keeps its own pooling
+'''
+def engine_options(database_path=database_path):
+  options = {
+    'pool_pre_ping': os.environ.get('DB_POOL_PRE_PING', 'true').lower() == 'true',
+    'pool_recycle': int(os.environ.get('DB_POOL_RECYCLE', 1800)),
+  }
+
+  if not database_path.startswith('sqlite'):
+    options.update({
+      'poolclass': TimedQueuePool,
+      'pool_size': int(os.environ.get('DB_POOL_SIZE', 5)),
+      'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW', 10)),
+      'pool_timeout': int(os.environ.get('DB_POOL_TIMEOUT', 30)),
+    })
+
+  return options
+
+'''
+pool_stats()
+    live statistics of the connection pool of the database engine
+'''
+def pool_stats():
+  pool = db.engine.pool
+  stats = {'pool': pool.__class__.__name__}
+
+  for name in ['size', 'checkedin', 'checkedout', 'overflow']:
+    if hasattr(pool, name):
+      stats[name] = getattr(pool, name)()
+
+  if isinstance(pool, TimedQueuePool):
+    stats['checkouts'] = pool.checkouts
+    stats['wait_time_total'] = round(pool.wait_time, 6)
+    stats['wait_time_max'] = round(pool.max_wait_time, 6)
+    stats['wait_time_avg'] = round(pool.wait_time / pool.checkouts, 6) if pool.checkouts else 0.0
+
+  return stats
+
 '''
 setup_db(app)
     binds a flask application and a SQLAlchemy service
+    engine options already set in the app config take precedence over engine_options()
 '''
 def setup_db(app, database_path=database_path):
     app.config["SQLALCHEMY_DATABASE_URI"] = database_path
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    app.config.setdefault("SQLALCHEMY_ENGINE_OPTIONS", engine_options(database_path))
     app.config["SECRET_KEY"] = secret_key
     db.app = app
     db.init_app(app)
+    migrate.init_app(app, db, directory=migrations_path)
+
+'''
+db_create_all()
+    creates the tables of a new, empty database without going through the migrations
+    the schema is never created on app start, run `flask db upgrade` (or `flask create-db`,
+    which also stamps the database with the latest revision) instead
+'''
+def db_create_all():
     db.create_all()
 
+'''
+question_caches
+    caches of question data, invalidated whenever questions are inserted, updated or deleted
+    any object with an invalidate() method can be registered with register_cache()
+'''
+question_caches = WeakSet()
+
+def register_cache(cache):
+  question_caches.add(cache)
+  return cache
+
+def invalidate_caches():
+  for cache in list(question_caches):
+    cache.invalidate()
+
+'''
+batch()
+    groups model writes into a single transaction
+    insert(), update() and delete() called within the block only flush their changes,
+    the block commits them at once when it ends (or rolls them back on an exception)
+    blocks can be nested, only the outermost one commits
+    EXAMPLE
+        with batch():
+            for question in questions:
+                question.insert()
+'''
+@contextmanager
+def batch():
+  info = db.session.info
+  depth = info.get('batch_depth', 0)
+  info['batch_depth'] = depth + 1
+
+  try:
+    yield db.session
+  except:
+    if not depth:
+      db.session.rollback()
+    raise
+  finally:
+    info['batch_depth'] = depth
+
+  if not depth:
+    try:
+      db.session.commit()
+    except:
+      db.session.rollback()
+      raise
+    invalidate_caches()
+
+'''
+save_changes()
+    commits the changes of the session, or only flushes them within a batch()
+'''
+def save_changes():
+  if db.session.info.get('batch_depth'):
+    db.session.flush()
+    return
+
+  db.session.commit()
+  invalidate_caches()
+
 '''
 Question
 
@@ -34,9 +179,16 @@ class Question(db.Model):
   id = Column(Integer, primary_key=True)
   question = Column(String)
   answer = Column(String)
-  category = Column(String)
+  category = Column(Integer, ForeignKey('categories.id', name='category', onupdate='CASCADE', ondelete='SET NULL'))
   difficulty = Column(Integer)
 
+  __table_args__ = (
+    # Serves the category filters (leading column) as well as their ORDER BY id
+    Index('ix_questions_category_id', 'category', 'id'),
+    # Serves the ILIKE '%term%' question search on Postgres (a plain index elsewhere)
+    Index('questions_question_trgm_idx', 'question', postgresql_using='gin', postgresql_ops={'question': 'gin_trgm_ops'}),
+  )
+
   def __init__(self, question, answer, category, difficulty):
     self.question = question
     self.answer = answer
@@ -45,14 +197,42 @@ class Question(db.Model):
 
   def insert(self):
     db.session.add(self)
-    db.session.commit()
+    save_changes()
 
   def update(self):
-    db.session.commit()
+    save_changes()
 
   def delete(self):
     db.session.delete(self)
-    db.session.commit()
+    save_changes()
+
+  '''
+  bulk_insert(rows)
+      inserts dicts of question, answer, category and difficulty in one transaction,
+      using a single executemany INSERT
+  '''
+  @classmethod
+  def bulk_insert(cls, rows):
+    rows = list(rows)
+    with batch():
+      if rows:
+        db.session.execute(cls.__table__.insert(), rows)
+    return len(rows)
+
+  '''
+  bulk_delete(ids)
+      deletes the questions with the given IDs in one transaction,
+      returns the number of deleted questions
+  '''
+  @classmethod
+  def bulk_delete(cls, ids, chunk_size=500):
+    ids = list(ids)
+    deleted = 0
+    with batch():
+      for start in range(0, len(ids), chunk_size):
+        chunk = ids[start:start + chunk_size]
+        deleted += cls.query.filter(cls.id.in_(chunk)).delete(synchronize_session=False)
+    return deleted
 
   def format(self):
     return {
@@ -63,6 +243,33 @@ class Question(db.Model):
       'difficulty': self.difficulty
     }
 
+  '''
+  format_columns()
+      the columns read by format_row(), select them with Question.query.with_entities()
+      to load questions as plain rows instead of ORM objects
+  '''
+  @classmethod
+  def format_columns(cls):
+    return [cls.id, cls.question, cls.answer, cls.category, cls.difficulty]
+
+  '''
+  format_row(row)
+      same representation as format() for a row starting with the format_columns()
+  '''
+  @staticmethod
+  def format_row(row):
+    return {
+      'id': row[0],
+      'question': row[1],
+      'answer': row[2],
+      'category': row[3],
+      'difficulty': row[4]
+    }
+
+# The trigram index of the questions needs pg_trgm when the tables are created from the models
+event.listen(Question.__table__, 'before_create',
+             DDL('CREATE EXTENSION IF NOT EXISTS pg_trgm').execute_if(dialect='postgresql'))
+
 '''
 Category
 
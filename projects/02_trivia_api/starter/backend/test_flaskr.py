@@ -1,51 +1,94 @@
 import os
+import pickle
+import subprocess
+import sys
+import tempfile
+import threading
 import unittest
 import json
-from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import func, Integer
 
-from flaskr import create_app
-from models import setup_db, Question, Category
+from models import db, batch, Question, Category
+from testing import DatabaseTestCase
+from flaskr import pagination
+from flaskr.quiz import QuizSession
 
 
-db_user = os.environ.get('DB_USER')
-db_password = os.environ.get('DB_PASS')
-
-class TriviaTestCase(unittest.TestCase):
+class TriviaTestCase(DatabaseTestCase):
     """This class represents the trivia test case"""
 
     def setUp(self):
-        """Define test variables and initialize app."""
-        self.app = create_app()
-        self.client = self.app.test_client
-        self.database_name = "trivia_test"
-        self.database_path = "postgres://{}:{}@{}/{}".format(db_user, db_password, 'localhost:5432', self.database_name)
-        setup_db(self.app, self.database_path)
-
-        # binds the app to the current context
-        with self.app.app_context():
-            self.db = SQLAlchemy()
-            self.db.init_app(self.app)
-            # create all tables
-            self.db.create_all()
-
-            self.new_question = {
-                "question": "How many colors are there in the rainbow?",
-                "answer": "7 colors",
-                "category": 1,
-                "difficulty": 1,
-            }
-
-    def tearDown(self):
-        """Executed after reach test"""
-        with self.app.app_context():
-            self.db.session.rollback()
-            self.db.session.close()
+        """Define test variables; the app, the database and the test transaction come from DatabaseTestCase."""
+        super().setUp()
+        self.db = db
+
+        self.new_question = {
+            "question": "How many colors are there in the rainbow?",
+            "answer": "7 colors",
+            "category": 1,
+            "difficulty": 1,
+        }
+
+    def query_plan(self, query):
+        """Returns the query plan of a query, with sequential scans disabled where the database allows it"""
+        statement = str(query.statement.compile(dialect=db.engine.dialect, compile_kwargs={'literal_binds': True}))
+
+        with db.engine.connect() as connection:
+            if db.engine.dialect.name == 'postgresql':
+                with connection.begin():
+                    connection.execute('SET LOCAL enable_seqscan = off')
+                    return '\n'.join(row[0] for row in connection.execute('EXPLAIN ' + statement))
+
+            return '\n'.join(row[-1] for row in connection.execute('EXPLAIN QUERY PLAN ' + statement))
 
     """
     TODO
     Write at least one test for each test for successful operation and for expected errors.
     """
 
+    def test_get_db_metrics(self):
+        res = self.client().get('/metrics/db')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertTrue(data['pool']['pool'])
+        if data['pool']['pool'] == 'TimedQueuePool':
+            self.assertTrue(data['pool']['checkouts'])
+            self.assertTrue('checkedout' in data['pool'])
+
+    def test_server_timing(self):
+        res = self.client().get('/questions?page=2')
+
+        self.assertEqual(res.status_code, 200)
+        self.assertRegex(res.headers['Server-Timing'], r'^db;dur=[\d.]+;desc="[1-9]\d* queries, \d+ rows", db-slowest;dur=[\d.]+, total;dur=[\d.]+$')
+
+    def test_get_request_metrics(self):
+        self.client().get('/categories')
+        res = self.client().get('/metrics/requests')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertIn('GET get_categories', [endpoint['endpoint'] for endpoint in data['endpoints']])
+
+    def test_seed_schema(self):
+        columns = {column.name: column for column in db.Table('questions', db.MetaData(), autoload_with=db.engine).columns}
+
+        self.assertTrue(isinstance(columns['category'].type, Integer))
+        self.assertEqual([key.column.table.name for key in columns['category'].foreign_keys], ['categories'])
+
+    def test_category_queries_use_index(self):
+        columns = Question.format_columns()
+        queries = [
+            Question.query.with_entities(*columns).filter_by(category=1).order_by(Question.id).limit(10),
+            Question.query.with_entities(func.count(Question.id)).filter_by(category=1),
+            Question.query.with_entities(*columns).filter(Question.id > 5).order_by(Question.id).limit(10),
+        ]
+
+        for query in queries:
+            self.assertNotRegex(self.query_plan(query), r'(?m)Seq Scan|^SCAN')
+
     def test_get_categories(self):
         res = self.client().get('/categories')
         data = json.loads(res.data)
@@ -88,6 +131,112 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(data['success'], False)
         self.assertEqual(data['error'], 404)
 
+    def test_stream_get_questions(self):
+        res = self.client().get('/questions', headers={'Accept': 'application/x-ndjson'})
+        questions = [json.loads(line) for line in res.data.decode('utf-8').splitlines()]
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.mimetype, 'application/x-ndjson')
+        self.assertEqual(len(questions), Question.query.count())
+        self.assertEqual(questions[0], Question.query.order_by(Question.id).first().format())
+
+    def test_stream_get_category_questions(self):
+        res = self.client().get('/categories/1/questions?format=ndjson')
+        questions = [json.loads(line) for line in res.data.decode('utf-8').splitlines()]
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(len(questions), Question.query.filter_by(category=1).count())
+
+    def test_304_get_questions(self):
+        first = self.client().get('/questions')
+        res = self.client().get('/questions', headers={'If-None-Match': first.headers['ETag']})
+
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(res.status_code, 304)
+        self.assertEqual(res.data, b'')
+
+    def test_count_cache_is_bounded(self):
+        cache = pagination.CountCache(ttl=0, max_entries=2)
+        counts = [cache.count(Question.query.filter(Question.difficulty == difficulty)) for difficulty in range(1, 6)]
+
+        self.assertEqual(counts, [Question.query.filter_by(difficulty=difficulty).count() for difficulty in range(1, 6)])
+        self.assertEqual(len(cache._counts), 1)
+
+        cache.ttl = 60
+        for difficulty in range(1, 6):
+            cache.count(Question.query.filter(Question.difficulty == difficulty))
+        self.assertEqual(len(cache._counts), 2)
+
+    def test_get_questions_after_add_question(self):
+        first_page = json.loads(self.client().get('/questions').data)
+        question = Question(**self.new_question)
+        question.insert()
+
+        res = self.client().get('/questions')
+        data = json.loads(res.data)
+        question.delete()
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['total_questions'], first_page['total_questions'] + 1)
+
+    def test_get_questions_second_page(self):
+        first_page = json.loads(self.client().get('/questions?page=1').data)
+        res = self.client().get('/questions?page=2')
+        data = json.loads(res.data)
+
+        first_ids = [question['id'] for question in first_page['questions']]
+        second_ids = [question['id'] for question in data['questions']]
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertEqual(data['total_questions'], first_page['total_questions'])
+        self.assertEqual(len(second_ids), min(10, data['total_questions'] - 10))
+        self.assertTrue(max(first_ids) < min(second_ids))
+
+    def test_get_questions_after_cursor(self):
+        first_page = json.loads(self.client().get('/questions?after=').data)
+        res = self.client().get('/questions?after={}'.format(first_page['next_cursor']))
+        data = json.loads(res.data)
+
+        second_page = json.loads(self.client().get('/questions?page=2').data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertTrue(first_page['next_cursor'])
+        self.assertEqual(data['questions'], second_page['questions'])
+        self.assertEqual(data['total_questions'], first_page['total_questions'])
+
+    def test_400_get_questions_after_cursor(self):
+        res = self.client().get('/questions?after=not-a-cursor')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 400)
+        self.assertEqual(data['success'], False)
+        self.assertEqual(data['error'], 400)
+
+    def test_400_get_questions_after_mistyped_cursor(self):
+        for values in [[{"a": 1}], [None], [[1, 2]], ["abc"], [True], [1, 2]]:
+            res = self.client().get('/questions?after={}'.format(pagination.encode_cursor(values)))
+            data = json.loads(res.data)
+
+            self.assertEqual(res.status_code, 400, values)
+            self.assertEqual(data['error'], 400)
+
+    def test_400_get_questions_by_category_after_mistyped_cursor(self):
+        res = self.client().get('/categories/1/questions?after={}'.format(pagination.encode_cursor([{"a": 1}])))
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 400)
+        self.assertEqual(data['error'], 400)
+
+    def test_400_search_questions_after_mistyped_cursor(self):
+        res = self.client().post('/questions/search?after={}'.format(pagination.encode_cursor(["abc", 1])),
+                                 json={'searchTerm': 'title'})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 400)
+        self.assertEqual(data['error'], 400)
+
     def test_get_category_questions(self):
         res = self.client().get('/categories/1/questions')
         data = json.loads(res.data)
@@ -140,6 +289,39 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(data['success'], True)
         self.assertEqual(data['question_id'], question_id)
 
+    def test_delete_questions(self):
+        questions = [Question(**self.new_question) for _ in range(3)]
+        with batch():
+            for question in questions:
+                question.insert()
+        question_ids = [question.id for question in questions]
+
+        res = self.client().delete('/questions', json={'questions': question_ids + [1000]})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertEqual(data['total_deleted'], 3)
+        self.assertEqual(Question.query.filter(Question.id.in_(question_ids)).count(), 0)
+
+    def test_batch_rollback(self):
+        total_questions = Question.query.count()
+
+        with self.assertRaises(ValueError):
+            with batch():
+                Question(**self.new_question).insert()
+                raise ValueError()
+
+        self.assertEqual(Question.query.count(), total_questions)
+
+    def test_400_delete_questions(self):
+        res = self.client().delete('/questions', json={'questions': 'all'})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 400)
+        self.assertEqual(data['success'], False)
+        self.assertEqual(data['error'], 400)
+
     def test_404_delete_question(self):
         res = self.client().delete('/questions/1000')
         data = json.loads(res.data)
@@ -148,6 +330,53 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(data['success'], False)
         self.assertEqual(data['error'], 404)
 
+    def test_import_questions(self):
+        rows = [
+            json.dumps(self.new_question),
+            json.dumps({"question": "Where is the answer?", "category": 1, "difficulty": 1}),
+            'not json',
+        ]
+        res = self.client().post('/questions/import', data='\n'.join(rows), content_type='application/x-ndjson')
+        data = json.loads(res.data)
+
+        for question in Question.query.filter_by(question=self.new_question['question']).all():
+            question.delete()
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertEqual(data['inserted'], 1)
+        self.assertEqual(data['rejected'], 2)
+        self.assertEqual([error['row'] for error in data['errors']], [2, 3])
+
+    def test_import_questions_rejected_by_database(self):
+        rows = [
+            json.dumps(self.new_question),
+            # passes validation, but does not fit the integer column
+            json.dumps(dict(self.new_question, difficulty=10 ** 20)),
+            json.dumps(self.new_question),
+        ]
+        res = self.client().post('/questions/import', data='\n'.join(rows), content_type='application/x-ndjson')
+        data = json.loads(res.data)
+
+        for question in Question.query.filter_by(question=self.new_question['question']).all():
+            question.delete()
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['inserted'], 2)
+        self.assertEqual(data['rejected'], 1)
+        self.assertEqual(data['errors'][0]['row'], 2)
+        self.assertTrue(data['errors'][0]['error'].startswith('Not inserted: '))
+        self.assertGreater(len(data['errors'][0]['error']), len('Not inserted: '))
+
+    def test_export_questions(self):
+        res = self.client().get('/questions/export')
+        rows = [json.loads(line) for line in res.data.decode('utf-8').splitlines() if line]
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.mimetype, 'application/x-ndjson')
+        self.assertEqual(len(rows), Question.query.count())
+        self.assertEqual(sorted(rows[0].keys()), ['answer', 'category', 'difficulty', 'id', 'question'])
+
     def test_search_questions(self):
         search_term = 'title'
         questions = Question.query.filter(Question.question.ilike('%{}%'.format(search_term))).all()
@@ -159,6 +388,20 @@ class TriviaTestCase(unittest.TestCase):
         self.assertTrue(data['questions'])
         self.assertEqual(len(data['questions']), len(questions))
 
+    def test_search_questions_ranked(self):
+        search_term = 'what'
+
+        res = self.client().post('/questions/search', json={'searchTerm':search_term})
+        data = json.loads(res.data)
+
+        positions = [question['question'].lower().find(search_term) for question in data['questions']]
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertTrue(data['questions'])
+        self.assertTrue(min(positions) >= 0)
+        self.assertEqual(positions, sorted(positions))
+
     def test_400_search_questions(self):
         res = self.client().post('/questions/search', json={'wrongDataKey':'fail'})
         data = json.loads(res.data)
@@ -167,6 +410,29 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(data['success'], False)
         self.assertEqual(data['error'], 400)
 
+    def test_400_search_questions_with_mistyped_search_term(self):
+        res = self.client().post('/questions/search', json={'searchTerm': 5})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 400)
+        self.assertEqual(data['error'], 400)
+
+    def test_400_stream_search_questions_with_mistyped_search_term(self):
+        res = self.client().post('/questions/search', json={'searchTerm': 5},
+                                 headers={'Accept': 'application/x-ndjson'})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 400)
+        self.assertEqual(data['error'], 400)
+
+    def test_stream_search_questions(self):
+        res = self.client().post('/questions/search', json={'searchTerm': 'title'},
+                                 headers={'Accept': 'application/x-ndjson'})
+        questions = [json.loads(line) for line in res.data.decode('utf-8').splitlines()]
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(len(questions), Question.query.filter(Question.question.ilike('%title%')).count())
+
     def test_play_quiz(self):
         quiz_info = {
         'previous_questions': [],
@@ -181,6 +447,83 @@ class TriviaTestCase(unittest.TestCase):
         self.assertTrue(data['question'])
         self.assertTrue(data['question']['id'] not in quiz_info['previous_questions'])
 
+    def test_play_quiz_last_question_of_category(self):
+        question_ids = [question.id for question in Question.query.filter_by(category=1).all()]
+        quiz_info = {
+        'previous_questions': question_ids[:-1],
+        'quiz_category': {"id": "1", "type": "science"},
+        }
+        res = self.client().post('/quizzes/play', json=quiz_info)
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertEqual(data['question']['id'], question_ids[-1])
+
+    def test_play_quiz_all_questions_played(self):
+        question_ids = [question.id for question in Question.query.filter_by(category=1).all()]
+        quiz_info = {
+        'previous_questions': question_ids,
+        'quiz_category': {"id": 1, "type": "science"},
+        }
+        res = self.client().post('/quizzes/play', json=quiz_info)
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertEqual(data['question'], None)
+
+    def test_quiz_session(self):
+        question_ids = [question.id for question in Question.query.filter_by(category=1).all()]
+
+        res = self.client().post('/quizzes', json={'quiz_category': {"id": "1", "type": "science"}})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertEqual(data['total_questions'], len(question_ids))
+
+        played = []
+        for _ in question_ids:
+            turn = json.loads(self.client().post('/quizzes/{}/next'.format(data['quiz_id'])).data)
+            played.append(turn['question']['id'])
+
+        last_turn = json.loads(self.client().post('/quizzes/{}/next'.format(data['quiz_id'])).data)
+
+        self.assertEqual(sorted(played), sorted(question_ids))
+        self.assertEqual(last_turn['question'], None)
+        self.assertEqual(last_turn['remaining_questions'], 0)
+
+    def test_quiz_session_concurrent_turns(self):
+        quiz = QuizSession(1, range(20000))
+        played = []
+
+        def play():
+            question_ids = []
+            while True:
+                question_id = quiz.pop()
+                if question_id is None:
+                    break
+                question_ids.append(question_id)
+            played.extend(question_ids)
+
+        threads = [threading.Thread(target=play) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(sorted(played), list(range(20000)))
+        self.assertEqual(pickle.loads(pickle.dumps(quiz)).remaining, 0)
+
+    def test_404_quiz_session(self):
+        res = self.client().post('/quizzes/unknown/next')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 404)
+        self.assertEqual(data['success'], False)
+        self.assertEqual(data['error'], 404)
+
     def test_400_play_quiz(self):
         missing_quiz_info = {
             'previous_questions': [20],
@@ -191,6 +534,64 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(data['success'], False)
         self.assertEqual(data['error'], 400)
 
+class BenchmarkTestCase(unittest.TestCase):
+    """Smoke tests running every benchmark script on a tiny dataset, so refactors cannot silently break them"""
+
+    def run_benchmark(self, script, *args):
+        backend = os.path.dirname(os.path.abspath(__file__))
+        result = subprocess.run(
+            [sys.executable, os.path.join(backend, 'benchmarks', script)] + list(args),
+            cwd=backend, stdout=subprocess.PIPE, stderr=subprocess.PIPE, timeout=300)
+
+        self.assertEqual(result.returncode, 0, result.stderr.decode())
+        return json.loads(result.stdout.decode())
+
+    def test_serialization_benchmark(self):
+        data = self.run_benchmark('serialization.py', '--rows', '50', '--repeat', '1')
+
+        self.assertEqual(data['rows'], 50)
+
+    def test_startup_benchmark(self):
+        data = self.run_benchmark('startup.py', '--repeat', '1')
+
+        self.assertIn('create_app_ms', data)
+
+    def test_load_benchmark(self):
+        with tempfile.TemporaryDirectory() as directory:
+            data = self.run_benchmark(
+                'load.py', '--questions', '50', '--clients', '2', '--requests', '10', '--warmup', '1',
+                '--database', 'sqlite:///{}'.format(os.path.join(directory, 'load.db')))
+
+        self.assertEqual(data['questions'], 50)
+        for endpoint in data['endpoints'].values():
+            self.assertEqual(endpoint['errors'], 0)
+
+
+
+class CommandTestCase(unittest.TestCase):
+    """Runs the flask commands setting up a database, in a separate process against a new SQLite file"""
+
+    def run_flask(self, database, *args):
+        backend = os.path.dirname(os.path.abspath(__file__))
+        # run from elsewhere than the backend folder, which must not matter
+        env = dict(os.environ, FLASK_APP='flaskr', PYTHONPATH=backend, DATABASE_URL='sqlite:///{}'.format(database))
+        return subprocess.run(
+            [sys.executable, '-m', 'flask'] + list(args),
+            cwd=tempfile.gettempdir(), env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE, timeout=300)
+
+    def test_create_db_then_upgrade(self):
+        with tempfile.TemporaryDirectory() as directory:
+            database = os.path.join(directory, 'trivia.db')
+            created = self.run_flask(database, 'create-db')
+            upgraded = self.run_flask(database, 'db', 'upgrade')
+            current = self.run_flask(database, 'db', 'current')
+            created_again = self.run_flask(database, 'create-db')
+
+        self.assertEqual(created.returncode, 0, created.stderr.decode())
+        self.assertEqual(upgraded.returncode, 0, upgraded.stderr.decode())
+        self.assertIn('(head)', current.stdout.decode())
+        self.assertNotEqual(created_again.returncode, 0)
+
 # Make the tests conveniently executable
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,159 @@
+'''
+Test harness of the trivia API
+
+The app and the database schema are set up once per test process, every test then
+runs inside a transaction that is rolled back when it ends, so tests neither see
+each other's writes nor have to clean up after themselves. Commits and rollbacks
+made by the app during a test only release or roll back a savepoint.
+
+The database is chosen with the TEST_DATABASE_URL environment variable:
+
+- unset: the trivia_test Postgres database, restored from trivia.psql and migrated
+  (see the README)
+- sqlite:// : an in-memory SQLite database per test process, created from the
+  models and seeded with the data of trivia.psql, so no server is needed and
+  the suite can run in parallel with pytest-xdist (`pytest -n auto`)
+'''
+import os
+import re
+import unittest
+
+from sqlalchemy import event
+from sqlalchemy.engine.url import make_url
+
+from flaskr import create_app
+from models import db, engine_options, invalidate_caches
+
+db_user = os.environ.get('DB_USER')
+db_password = os.environ.get('DB_PASS')
+database_path = os.environ.get('TEST_DATABASE_URL', "postgres://{}:{}@{}/{}".format(db_user, db_password, 'localhost:5432', 'trivia_test'))
+
+SEED_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'trivia.psql')
+
+COPY_BLOCK = re.compile(r'^COPY public\.(\w+) \(([^)]*)\) FROM stdin;\n(.*?)^\\\.$', re.M | re.S)
+
+_app = None
+
+# Whether a DatabaseTestCase transaction is open on the connection of an in-memory database
+_in_test_transaction = False
+
+
+def read_seed(path=SEED_FILE):
+    '''
+    Yields the table name and the rows of every COPY block of a pg_dump file
+    '''
+    with open(path) as seed:
+        text = seed.read()
+
+    for table, columns, body in COPY_BLOCK.findall(text):
+        columns = [column.strip() for column in columns.split(',')]
+        rows = [
+            dict(zip(columns, [None if value == '\\N' else value for value in line.split('\t')]))
+            for line in body.splitlines()
+        ]
+        yield table, rows
+
+
+def use_sqlite_savepoints(engine):
+    '''
+    Lets pysqlite emit SAVEPOINTs, which its own transaction handling breaks
+    '''
+    @event.listens_for(engine, 'connect')
+    def connect(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None
+
+    @event.listens_for(engine, 'begin')
+    def begin(connection):
+        connection.execute('BEGIN')
+
+
+def reset_in_memory_connection(dbapi_connection, connection_record):
+    '''
+    Rolls back the connection of an in-memory database when it is returned to the
+    pool, unless it holds the transaction of the running test
+    '''
+    if not _in_test_transaction:
+        dbapi_connection.rollback()
+
+
+def get_app():
+    '''
+    Returns the app shared by the tests of this process, setting up the database on first use
+    '''
+    global _app
+
+    if _app is None:
+        url = make_url(database_path)
+        options = engine_options(database_path)
+        in_memory = url.get_backend_name() == 'sqlite' and url.database in (None, '', ':memory:')
+        if in_memory:
+            # all sessions share the one connection of the in-memory database,
+            # returning it to the pool must not roll back the test transaction
+            # (see reset_in_memory_connection())
+            options['pool_reset_on_return'] = None
+
+        app = create_app({
+            'SQLALCHEMY_DATABASE_URI': database_path,
+            'SQLALCHEMY_ENGINE_OPTIONS': options,
+            'QUERY_PROFILING': True,
+        })
+
+        with app.app_context():
+            if url.get_backend_name() == 'sqlite':
+                use_sqlite_savepoints(db.engine)
+
+            if in_memory:
+                event.listen(db.engine, 'checkin', reset_in_memory_connection)
+                db.create_all()
+                with db.engine.begin() as connection:
+                    for table, rows in read_seed():
+                        connection.execute(db.metadata.tables[table].insert(), rows)
+
+        _app = app
+
+    return _app
+
+
+class DatabaseTestCase(unittest.TestCase):
+    '''
+    Runs every test in an app context, within a transaction rolled back at its end
+    '''
+
+    def setUp(self):
+        global _in_test_transaction
+
+        self.app = get_app()
+        self.client = self.app.test_client
+        self.context = self.app.app_context()
+        self.context.push()
+
+        self.connection = db.engine.connect()
+        self.transaction = self.connection.begin()
+        _in_test_transaction = True
+
+        self.scoped_session = db.session
+        session = db.create_scoped_session(options={'bind': self.connection, 'binds': {}})
+        # the session is removed after every request, it has to outlive the requests of a test
+        session.remove = lambda: None
+        db.session = session
+
+        session.begin_nested()
+
+        @event.listens_for(session(), 'after_transaction_end')
+        def restart_savepoint(session, transaction):
+            if transaction.nested and not transaction._parent.nested:
+                session.expire_all()
+                session.begin_nested()
+
+        invalidate_caches()
+
+    def tearDown(self):
+        global _in_test_transaction
+
+        db.session().close()
+        db.session = self.scoped_session
+        _in_test_transaction = False
+        self.transaction.rollback()
+        self.connection.close()
+        self.context.pop()
+        invalidate_caches()
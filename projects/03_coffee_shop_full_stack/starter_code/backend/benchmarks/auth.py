@@ -0,0 +1,166 @@
+'''
+Microbenchmark of token verification and of the requires_auth decorator
+
+A throwaway RSA key is generated and served as the key set by a local HTTP
+server (through JWKS_URL), tokens are signed with it.
+
+- verifications per second per core: verify_decode_jwt() against the public key
+  constructed once per key set fetch, and jwt.decode() given the JWK, which
+  constructs the key on every call, both on a single thread
+- overhead of the decorator per request: the decorated view is called --calls
+  times within one request context, once with every call verifying the token
+  (uncached) and once answered from the token cache; the time of the
+  undecorated view is subtracted
+
+Results are printed as JSON, so runs can be compared across commits.
+
+Run from the backend directory:
+    python benchmarks/auth.py [--calls 2000] [--seconds 2]
+'''
+import argparse
+import base64
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Crypto.PublicKey import RSA
+from flask import Flask
+from jose import jwt
+
+KID = 'benchmark'
+PERMISSION = 'get:drinks-detail'
+
+
+def jwk_of(key):
+    return {
+        'kty': 'RSA',
+        'kid': KID,
+        'use': 'sig',
+        'alg': 'RS256',
+        'n': base64url(key.publickey().n),
+        'e': base64url(key.publickey().e),
+    }
+
+
+def base64url(number):
+    return base64.urlsafe_b64encode(number.to_bytes((number.bit_length() + 7) // 8, 'big')).rstrip(b'=').decode()
+
+
+def serve_jwks(key):
+    '''
+    Serves the public part of `key` as a key set on a local port, returns its URL
+    '''
+    body = json.dumps({'keys': [jwk_of(key)]}).encode()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = HTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return 'http://127.0.0.1:{}/.well-known/jwks.json'.format(server.server_address[1])
+
+
+def sign(key, auth, permissions):
+    return jwt.encode({
+        'iss': 'https://' + auth.AUTH0_DOMAIN + '/',
+        'aud': auth.API_AUDIENCE,
+        'sub': 'benchmark',
+        'exp': int(time.time()) + 3600,
+        'permissions': permissions,
+    }, key.exportKey('PEM').decode(), algorithm='RS256', headers={'kid': KID})
+
+
+def per_second(function, seconds):
+    calls = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        function()
+        calls += 1
+    return calls / (time.perf_counter() - start)
+
+
+def time_calls(view, calls):
+    start = time.perf_counter()
+    for _ in range(calls):
+        view()
+    return (time.perf_counter() - start) / calls
+
+
+def commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--calls', type=int, default=2000, help='calls per measurement')
+    parser.add_argument('--permissions', type=int, default=20, help='number of permissions in the token')
+    parser.add_argument('--seconds', type=float, default=2, help='duration of each verification measurement')
+    args = parser.parse_args()
+
+    key = RSA.generate(2048)
+    os.environ['JWKS_URL'] = serve_jwks(key)
+
+    from src.auth import auth
+    from src.auth.tokens import TokenCache
+
+    permissions = ['benchmark:{}'.format(number) for number in range(args.permissions - 1)] + [PERMISSION]
+    token = sign(key, auth, permissions)
+
+    # fetches the key set and checks the token is accepted
+    auth.verify_decode_jwt(token)
+    verify_options = {
+        'algorithms': auth.ALGORITHMS,
+        'audience': auth.API_AUDIENCE,
+        'issuer': 'https://' + auth.AUTH0_DOMAIN + '/',
+    }
+    prebuilt = per_second(lambda: auth.verify_decode_jwt(token), args.seconds)
+    public_jwk = jwk_of(key)
+    per_call = per_second(lambda: jwt.decode(token, public_jwk, **verify_options), args.seconds)
+
+    def view(payload=None):
+        return payload
+
+    protected = auth.requires_auth(PERMISSION)(view)
+    app = Flask(__name__)
+
+    with app.test_request_context(headers={'Authorization': 'Bearer ' + token}):
+        bare = time_calls(view, args.calls)
+
+        cache = auth.token_cache
+        auth.token_cache = TokenCache(max_entries=0)
+        uncached = time_calls(protected, max(1, args.calls // 10))
+
+        auth.token_cache = cache
+        cached = time_calls(protected, args.calls)
+
+    print(json.dumps({
+        'commit': commit(),
+        'permissions': args.permissions,
+        'verifications_per_s': {
+            'prebuilt_key': round(prebuilt),
+            'key_per_call': round(per_call),
+        },
+        'uncached_us': round((uncached - bare) * 1e6, 2),
+        'cached_us': round((cached - bare) * 1e6, 2),
+        'speedup': round((uncached - bare) / (cached - bare), 1),
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,32 @@
+"""drinks, as created by db_drop_and_create_all()
+
+Revision ID: 2b7e0c9f4a18
+Revises: 
+Create Date: 2026-10-18 16:41:52.207315
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '2b7e0c9f4a18'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Databases set up with db_drop_and_create_all() (like src/database/database.db) already have the table
+    if 'drink' not in sa.inspect(op.get_bind()).get_table_names():
+        op.create_table('drink',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('title', sa.String(length=80), nullable=True),
+        sa.Column('recipe', sa.String(length=180), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('title')
+        )
+
+
+def downgrade():
+    op.drop_table('drink')
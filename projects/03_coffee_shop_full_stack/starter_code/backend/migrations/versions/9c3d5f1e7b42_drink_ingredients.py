@@ -0,0 +1,95 @@
+"""ingredient table replacing the JSON recipe of drinks
+
+Revision ID: 9c3d5f1e7b42
+Revises: 2b7e0c9f4a18
+Create Date: 2026-10-18 16:58:09.731840
+
+"""
+import json
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9c3d5f1e7b42'
+down_revision = '2b7e0c9f4a18'
+branch_labels = None
+depends_on = None
+
+
+drink = sa.table('drink',
+    sa.column('id', sa.Integer()),
+    sa.column('recipe', sa.String()),
+)
+
+
+def upgrade():
+    # Databases set up with db_drop_and_create_all() from the current models already
+    # have the ingredient table, and no recipe column to convert
+    if 'ingredient' in sa.inspect(op.get_bind()).get_table_names():
+        return
+
+    ingredient = op.create_table('ingredient',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('drink_id', sa.Integer(), nullable=False),
+    sa.Column('position', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(length=80), nullable=False),
+    sa.Column('color', sa.String(length=80), nullable=False),
+    sa.Column('parts', sa.Float(), nullable=False),
+    sa.ForeignKeyConstraint(['drink_id'], ['drink.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_ingredient_name', 'ingredient', ['name'], unique=False)
+    op.create_index('ix_ingredient_drink_id_position', 'ingredient', ['drink_id', 'position'], unique=False)
+
+    # The recipes are parsed one last time, into rows
+    connection = op.get_bind()
+    rows = []
+    for drink_id, recipe in connection.execute(sa.select([drink.c.id, drink.c.recipe])):
+        recipe = json.loads(recipe)
+        if isinstance(recipe, dict):
+            recipe = [recipe]
+        rows.extend({
+            'drink_id': drink_id,
+            'position': position,
+            'name': r['name'],
+            'color': r['color'],
+            'parts': float(r['parts']),
+        } for position, r in enumerate(recipe))
+
+    if rows:
+        op.bulk_insert(ingredient, rows)
+
+    with op.batch_alter_table('drink') as batch_op:
+        batch_op.drop_column('recipe')
+
+
+def downgrade():
+    with op.batch_alter_table('drink') as batch_op:
+        batch_op.add_column(sa.Column('recipe', sa.String(length=180), nullable=True))
+
+    ingredient = sa.table('ingredient',
+        sa.column('drink_id', sa.Integer()),
+        sa.column('position', sa.Integer()),
+        sa.column('name', sa.String()),
+        sa.column('color', sa.String()),
+        sa.column('parts', sa.Float()),
+    )
+    connection = op.get_bind()
+    recipes = {}
+    rows = connection.execute(sa.select([ingredient]).order_by(ingredient.c.drink_id, ingredient.c.position))
+    for row in rows:
+        parts = int(row.parts) if row.parts.is_integer() else row.parts
+        recipes.setdefault(row.drink_id, []).append({'color': row.color, 'name': row.name, 'parts': parts})
+
+    for drink_id, recipe in recipes.items():
+        connection.execute(drink.update().where(drink.c.id == drink_id).values(recipe=json.dumps(recipe)))
+    connection.execute(drink.update().where(drink.c.recipe.is_(None)).values(recipe='[]'))
+
+    with op.batch_alter_table('drink') as batch_op:
+        batch_op.alter_column('recipe', existing_type=sa.String(length=180), nullable=False)
+
+    op.drop_index('ix_ingredient_drink_id_position', table_name='ingredient')
+    op.drop_index('ix_ingredient_name', table_name='ingredient')
+    op.drop_table('ingredient')
@@ -4,12 +4,16 @@ from sqlalchemy import exc
 import json
 from flask_cors import CORS
 
-from .database.models import db_drop_and_create_all, setup_db, Drink
+from .database.models import db_drop_and_create_all, setup_db, pool_stats, register_cache, db, Drink
 from .auth.auth import AuthError, requires_auth
+from .profiling import QueryProfiler
+from .menu import DrinksMenu
 
 app = Flask(__name__)
 setup_db(app)
 CORS(app)
+profiler = QueryProfiler(app)
+menu = register_cache(DrinksMenu())
 
 '''
 @TODO uncomment the following line to initialize the datbase
@@ -20,59 +24,188 @@ CORS(app)
 
 ## ROUTES
 '''
-@TODO implement endpoint
-    GET /drinks
-        it should be a public endpoint
-        it should contain only the drink.short() data representation
-    returns status code 200 and json {"success": True, "drinks": drinks} where drinks is the list of drinks
-        or appropriate status code indicating reason for failure
+recipe_of(body)
+    the recipe of a request body, a list of ingredients {'color': string, 'name': string, 'parts': number}
+    a single ingredient is accepted as well, parts must be a positive number (fractions allowed)
+    aborts with 422 if the recipe is missing or malformed
 '''
+def recipe_of(body):
+    recipe = body.get('recipe')
+    if isinstance(recipe, dict):
+        recipe = [recipe]
 
+    if not isinstance(recipe, list) or not recipe:
+        abort(422)
+
+    for ingredient in recipe:
+        if not isinstance(ingredient, dict) or not {'color', 'name', 'parts'} <= ingredient.keys():
+            abort(422)
+
+        parts = ingredient['parts']
+        if isinstance(parts, bool) or not isinstance(parts, (int, float)) or not 0 < parts < float('inf'):
+            abort(422)
+
+    return [{'color': r['color'], 'name': r['name'], 'parts': r['parts']} for r in recipe]
 
 '''
-@TODO implement endpoint
-    GET /drinks-detail
-        it should require the 'get:drinks-detail' permission
-        it should contain the drink.long() data representation
-    returns status code 200 and json {"success": True, "drinks": drinks} where drinks is the list of drinks
-        or appropriate status code indicating reason for failure
+save(write)
+    writes a drink with its insert(), update() or delete() method (write)
+    aborts with 422 if the database rejects it, e.g. for a duplicate title
 '''
+def save(write):
+    try:
+        write()
+    except exc.SQLAlchemyError:
+        db.session.rollback()
+        abort(422)
+
+'''
+GET /drinks
+    a public endpoint
+    contains only the drink.short() data representation
+    the body is serialized once per write to the drinks (see DrinksMenu), with an ETag
+    ?ingredient=<name> only lists the drinks with that ingredient, selected by the database
+returns status code 200 and json {"success": True, "drinks": drinks} where drinks is the list of drinks
+    or 304 when the If-None-Match header holds the ETag of the current list
+'''
+@app.route('/drinks')
+def get_drinks():
+    ingredient = request.args.get('ingredient')
+    if ingredient is None:
+        return menu.response('short')
+
+    drinks = Drink.with_ingredient(ingredient).order_by(Drink.id).all()
+    return jsonify({
+        "success": True,
+        "drinks": [drink.short() for drink in drinks]
+    })
+
+
+'''
+GET /drinks-detail
+    requires the 'get:drinks-detail' permission
+    contains the drink.long() data representation
+returns status code 200 and json {"success": True, "drinks": drinks} where drinks is the list of drinks
+    or 304 when the If-None-Match header holds the ETag of the current list
+'''
+@app.route('/drinks-detail')
+@requires_auth('get:drinks-detail')
+def get_drinks_detail(payload):
+    return menu.response('long')
 
 
 '''
-@TODO implement endpoint
-    POST /drinks
-        it should create a new row in the drinks table
-        it should require the 'post:drinks' permission
-        it should contain the drink.long() data representation
-    returns status code 200 and json {"success": True, "drinks": drink} where drink an array containing only the newly created drink
-        or appropriate status code indicating reason for failure
+POST /drinks
+    creates a new row in the drinks table
+    requires the 'post:drinks' permission
+    contains the drink.long() data representation
+returns status code 200 and json {"success": True, "drinks": drink} where drink an array containing only the newly created drink
+    or 422 if the title or recipe is missing or malformed, or the title is taken
 '''
+@app.route('/drinks', methods=['POST'])
+@requires_auth('post:drinks')
+def create_drink(payload):
+    body = request.get_json(silent=True) or {}
+    title = body.get('title')
+    if not isinstance(title, str) or not title.strip():
+        abort(422)
+
+    drink = Drink(title=title.strip())
+    drink.set_recipe(recipe_of(body))
+    save(drink.insert)
+
+    return jsonify({
+        "success": True,
+        "drinks": [drink.long()]
+    })
 
 
 '''
-@TODO implement endpoint
-    PATCH /drinks/<id>
-        where <id> is the existing model id
-        it should respond with a 404 error if <id> is not found
-        it should update the corresponding row for <id>
-        it should require the 'patch:drinks' permission
-        it should contain the drink.long() data representation
-    returns status code 200 and json {"success": True, "drinks": drink} where drink an array containing only the updated drink
-        or appropriate status code indicating reason for failure
+PATCH /drinks/<id>
+    where <id> is the existing model id
+    responds with a 404 error if <id> is not found
+    updates the title and/or the recipe of the corresponding row for <id>
+    requires the 'patch:drinks' permission
+    contains the drink.long() data representation
+returns status code 200 and json {"success": True, "drinks": drink} where drink an array containing only the updated drink
+    or 422 if the title or recipe is malformed, or the title is taken
 '''
+@app.route('/drinks/<int:drink_id>', methods=['PATCH'])
+@requires_auth('patch:drinks')
+def update_drink(payload, drink_id):
+    drink = Drink.query.get(drink_id)
+    if drink is None:
+        abort(404)
+
+    body = request.get_json(silent=True) or {}
+    if 'title' in body:
+        title = body['title']
+        if not isinstance(title, str) or not title.strip():
+            abort(422)
+        drink.title = title.strip()
+
+    if 'recipe' in body:
+        drink.set_recipe(recipe_of(body))
+
+    save(drink.update)
+
+    return jsonify({
+        "success": True,
+        "drinks": [drink.long()]
+    })
 
 
 '''
-@TODO implement endpoint
-    DELETE /drinks/<id>
-        where <id> is the existing model id
-        it should respond with a 404 error if <id> is not found
-        it should delete the corresponding row for <id>
-        it should require the 'delete:drinks' permission
-    returns status code 200 and json {"success": True, "delete": id} where id is the id of the deleted record
-        or appropriate status code indicating reason for failure
+DELETE /drinks/<id>
+    where <id> is the existing model id
+    responds with a 404 error if <id> is not found
+    deletes the corresponding row for <id>
+    requires the 'delete:drinks' permission
+returns status code 200 and json {"success": True, "delete": id} where id is the id of the deleted record
 '''
+@app.route('/drinks/<int:drink_id>', methods=['DELETE'])
+@requires_auth('delete:drinks')
+def delete_drink(payload, drink_id):
+    drink = Drink.query.get(drink_id)
+    if drink is None:
+        abort(404)
+
+    save(drink.delete)
+
+    return jsonify({
+        "success": True,
+        "delete": drink_id
+    })
+
+
+'''
+GET /metrics/db
+    a public endpoint with live statistics of the database connection pool
+    returns status code 200 and json {"success": True, "pool": stats}
+'''
+@app.route('/metrics/db')
+def get_db_metrics():
+    return jsonify({
+        "success": True,
+        "pool": pool_stats()
+    })
+
+
+'''
+GET /metrics/requests
+    a public endpoint with the slowest endpoints of the last requests
+    only available when query profiling is enabled with QUERY_PROFILING=true
+    returns status code 200 and json {"success": True, "endpoints": report}
+'''
+@app.route('/metrics/requests')
+def get_request_metrics():
+    if not profiler.enabled:
+        abort(404)
+
+    return jsonify({
+        "success": True,
+        "endpoints": profiler.report()
+    })
 
 
 ## Error Handling
@@ -88,23 +221,52 @@ def unprocessable(error):
                     }), 422
 
 '''
-@TODO implement error handlers using the @app.errorhandler(error) decorator
-    each error handler should return (with approprate messages):
-             jsonify({
+error handlers for the other failure modes, in the same format
+'''
+@app.errorhandler(400)
+def bad_request(error):
+    return jsonify({
+                    "success": False, 
+                    "error": 400,
+                    "message": "bad request"
+                    }), 400
+
+
+@app.errorhandler(404)
+def not_found(error):
+    return jsonify({
                     "success": False, 
                     "error": 404,
                     "message": "resource not found"
                     }), 404
 
-'''
 
-'''
-@TODO implement error handler for 404
-    error handler should conform to general task above 
-'''
+@app.errorhandler(405)
+def method_not_allowed(error):
+    return jsonify({
+                    "success": False, 
+                    "error": 405,
+                    "message": "method not allowed"
+                    }), 405
+
+
+@app.errorhandler(500)
+def internal_server_error(error):
+    return jsonify({
+                    "success": False, 
+                    "error": 500,
+                    "message": "internal server error"
+                    }), 500
 
 
 '''
-@TODO implement error handler for AuthError
-    error handler should conform to general task above 
+error handler for AuthError
+    responds with the status code of the error and its description
 '''
+@app.errorhandler(AuthError)
+def auth_error(error):
+    return jsonify({
+                    "success": False, 
+                    "error": error.status_code,
+                    "message": error.error['description']
+                    }), error.status_code
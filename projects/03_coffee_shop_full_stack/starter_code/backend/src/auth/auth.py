@@ -1,14 +1,34 @@
+import os
 import json
 from flask import request, _request_ctx_stack
 from functools import wraps
-from jose import jwt
-from urllib.request import urlopen
+from jose import jwk, jwt
+from jose.exceptions import JWTError
+from jose.utils import base64url_decode
+
+from .jwks import JWKSCache, JWKSError
+from .tokens import Claims, TokenCache
 
 
 AUTH0_DOMAIN = 'udacity-fsnd.auth0.com'
 ALGORITHMS = ['RS256']
 API_AUDIENCE = 'dev'
 
+'''
+construct_key(key)
+    the public key of a JWK of the key set, ready to verify signatures
+'''
+def construct_key(key):
+    return jwk.construct(key, ALGORITHMS[0])
+
+# the Auth0 signing keys, fetched and constructed once and refreshed in the background
+# (JWKS_URL points the API at another key set, e.g. a local one for testing)
+JWKS_URL = os.environ.get('JWKS_URL', 'https://{}/.well-known/jwks.json'.format(AUTH0_DOMAIN))
+jwks_cache = JWKSCache(JWKS_URL, construct=construct_key)
+
+# the payloads of the tokens verified last, clients send the same token with every request
+token_cache = TokenCache(max_entries=int(os.environ.get('TOKEN_CACHE_SIZE', 1024)))
+
 ## AuthError Exception
 '''
 AuthError Exception
@@ -23,62 +43,172 @@ class AuthError(Exception):
 ## Auth Header
 
 '''
-@TODO implement get_token_auth_header() method
-    it should attempt to get the header from the request
-        it should raise an AuthError if no header is present
-    it should attempt to split bearer and the token
-        it should raise an AuthError if the header is malformed
-    return the token part of the header
+get_token_auth_header() method
+    gets the header from the request
+        raises an AuthError if no header is present
+    splits bearer and the token
+        raises an AuthError if the header is malformed
+    returns the token part of the header
 '''
 def get_token_auth_header():
-   raise Exception('Not Implemented')
+    auth = request.headers.get('Authorization', None)
+    if not auth:
+        raise AuthError({
+            'code': 'authorization_header_missing',
+            'description': 'Authorization header is expected.'
+        }, 401)
+
+    parts = auth.split()
+    if parts[0].lower() != 'bearer':
+        raise AuthError({
+            'code': 'invalid_header',
+            'description': 'Authorization header must start with "Bearer".'
+        }, 401)
+
+    elif len(parts) == 1:
+        raise AuthError({
+            'code': 'invalid_header',
+            'description': 'Token not found.'
+        }, 401)
+
+    elif len(parts) > 2:
+        raise AuthError({
+            'code': 'invalid_header',
+            'description': 'Authorization header must be bearer token.'
+        }, 401)
+
+    return parts[1]
 
 '''
-@TODO implement check_permissions(permission, payload) method
+check_permissions(permission, payload) method
     @INPUTS
         permission: string permission (i.e. 'post:drink')
         payload: decoded jwt payload
 
-    it should raise an AuthError if permissions are not included in the payload
+    raises an AuthError if permissions are not included in the payload
         !!NOTE check your RBAC settings in Auth0
-    it should raise an AuthError if the requested permission string is not in the payload permissions array
-    return true otherwise
+    raises an AuthError if the requested permission string is not in the payload permissions array
+    returns true otherwise
+
+    the permissions of a payload returned by requires_auth are looked up in its permission_set
 '''
 def check_permissions(permission, payload):
-    raise Exception('Not Implemented')
+    if 'permissions' not in payload:
+        raise AuthError({
+            'code': 'invalid_claims',
+            'description': 'Permissions not included in JWT.'
+        }, 400)
+
+    permissions = payload.permission_set if isinstance(payload, Claims) else payload['permissions']
+    if permission and permission not in permissions:
+        raise AuthError({
+            'code': 'unauthorized',
+            'description': 'Permission not found.'
+        }, 403)
+
+    return True
 
 '''
-@TODO implement verify_decode_jwt(token) method
+verify_decode_jwt(token) method
     @INPUTS
         token: a json web token (string)
 
-    it should be an Auth0 token with key id (kid)
-    it should verify the token using Auth0 /.well-known/jwks.json
-    it should decode the payload from the token
-    it should validate the claims
-    return the decoded payload
+    the token must be an Auth0 token with key id (kid)
+    verifies the token signature with the constructed Auth0 /.well-known/jwks.json key (see jwks_cache)
+    decodes the payload from the token
+    validates the claims
+    returns the decoded payload
 
     !!NOTE urlopen has a common certificate error described here: https://stackoverflow.com/questions/50236117/scraping-ssl-certificate-verify-failed-error-for-http-en-wikipedia-org
 '''
 def verify_decode_jwt(token):
-    raise Exception('Not Implemented')
+    try:
+        unverified_header = jwt.get_unverified_header(token)
+    except JWTError:
+        raise AuthError({
+            'code': 'invalid_header',
+            'description': 'Unable to parse authentication token.'
+        }, 401)
+
+    if 'kid' not in unverified_header or unverified_header.get('alg') not in ALGORITHMS:
+        raise AuthError({
+            'code': 'invalid_header',
+            'description': 'Authorization malformed.'
+        }, 401)
+
+    try:
+        key = jwks_cache.get_key(unverified_header['kid'])
+    except JWKSError:
+        raise AuthError({
+            'code': 'jwks_unavailable',
+            'description': 'Unable to fetch the signing keys.'
+        }, 503)
+
+    if key is None:
+        raise AuthError({
+            'code': 'invalid_header',
+            'description': 'Unable to find the appropriate key.'
+        }, 400)
+
+    try:
+        signing_input, signature = token.encode('utf-8').rsplit(b'.', 1)
+        verified = key.verify(signing_input, base64url_decode(signature))
+    except Exception:
+        verified = False
+
+    if not verified:
+        raise AuthError({
+            'code': 'invalid_signature',
+            'description': 'Signature verification failed.'
+        }, 401)
+
+    try:
+        # the signature was verified above, only the claims are left to validate
+        return jwt.decode(
+            token,
+            {},
+            algorithms=ALGORITHMS,
+            audience=API_AUDIENCE,
+            issuer='https://' + AUTH0_DOMAIN + '/',
+            options={'verify_signature': False}
+        )
+
+    except jwt.ExpiredSignatureError:
+        raise AuthError({
+            'code': 'token_expired',
+            'description': 'Token expired.'
+        }, 401)
+
+    except jwt.JWTClaimsError:
+        raise AuthError({
+            'code': 'invalid_claims',
+            'description': 'Incorrect claims. Please, check the audience and issuer.'
+        }, 401)
+
+    except Exception:
+        raise AuthError({
+            'code': 'invalid_header',
+            'description': 'Unable to parse authentication token.'
+        }, 400)
 
 '''
-@TODO implement @requires_auth(permission) decorator method
+@requires_auth(permission) decorator method
     @INPUTS
         permission: string permission (i.e. 'post:drink')
 
-    it should use the get_token_auth_header method to get the token
-    it should use the verify_decode_jwt method to decode the jwt
-    it should use the check_permissions method validate claims and check the requested permission
-    return the decorator which passes the decoded payload to the decorated method
+    uses the get_token_auth_header method to get the token
+    uses the verify_decode_jwt method to decode the jwt, unless the token was verified before (see token_cache)
+    uses the check_permissions method validate claims and check the requested permission
+    returns the decorator which passes the decoded payload to the decorated method
 '''
 def requires_auth(permission=''):
     def requires_auth_decorator(f):
         @wraps(f)
         def wrapper(*args, **kwargs):
             token = get_token_auth_header()
-            payload = verify_decode_jwt(token)
+            payload = token_cache.get(token)
+            if payload is None:
+                payload = token_cache.put(token, verify_decode_jwt(token))
             check_permissions(permission, payload)
             return f(payload, *args, **kwargs)
 
@@ -0,0 +1,146 @@
+import json
+import logging
+import threading
+import time
+from urllib.request import urlopen
+
+logger = logging.getLogger(__name__)
+
+
+class JWKSError(Exception):
+    '''
+    The key set could not be fetched and no usable keys are cached
+    '''
+
+
+class JWKSCache:
+    '''
+    The signing keys of a JSON Web Key Set URL, by their key id (kid)
+
+    The key set is fetched on first use and kept for `ttl` seconds. From
+    `refresh_ahead` seconds before it expires, a lookup starts a refresh in a
+    background thread and is answered from the cached keys, so requests do not
+    wait for the network while the keys are being renewed. A kid missing from
+    the cached keys (the issuer rotated its keys) refetches the key set right
+    away. Concurrent lookups share a single fetch, and refetches (and retries
+    after a failed fetch) happen at most once every `min_interval` seconds.
+
+    When a fetch fails the cached keys keep being served (stale-while-revalidate),
+    up to `max_stale` seconds past their ttl.
+
+    `construct` turns every JWK of a fetched key set into the key object that is
+    cached (e.g. a public key ready to verify signatures), so that work is done
+    once per fetch instead of once per lookup. Keys it fails on are left out.
+    '''
+
+    def __init__(self, url, ttl=600, refresh_ahead=60, min_interval=10, max_stale=86400, timeout=5, construct=None):
+        self.url = url
+        self.construct = construct
+        self.ttl = ttl
+        self.refresh_ahead = refresh_ahead
+        self.min_interval = min_interval
+        self.max_stale = max_stale
+        self.timeout = timeout
+
+        self._keys = None
+        self._fetched_at = None
+        self._attempted_at = None
+        self._error = None
+        self._fetching = False
+        self._condition = threading.Condition()
+
+    def fetch(self):
+        '''
+        Returns the keys of the key set by their kid, constructed
+        '''
+        with urlopen(self.url, timeout=self.timeout) as response:
+            jwks = json.loads(response.read())
+
+        keys = {}
+        for key in jwks['keys']:
+            if 'kid' not in key:
+                continue
+
+            try:
+                keys[key['kid']] = self.construct(key) if self.construct is not None else key
+            except Exception as error:
+                logger.warning('Skipping key %s of %s: %s', key['kid'], self.url, error)
+
+        return keys
+
+    def get_key(self, kid):
+        '''
+        Returns the (constructed) key with the given kid, None when the key set has no such key
+
+        Raises JWKSError when the key set cannot be fetched and no usable keys are cached.
+        '''
+        now = time.monotonic()
+
+        if not self._usable(now):
+            self.refresh()
+        elif kid not in self._keys:
+            # waits for a fetch in flight, refetches unless the last fetch is too recent
+            self.refresh()
+        elif now - self._fetched_at >= self.ttl - self.refresh_ahead:
+            self.refresh_in_background()
+
+        return self._keys.get(kid)
+
+    def refresh(self):
+        '''
+        Fetches the key set, or waits for the fetch already in flight
+
+        Does nothing when the last fetch started less than `min_interval` seconds ago.
+        '''
+        with self._condition:
+            if self._fetching:
+                self._condition.wait_for(lambda: not self._fetching)
+                if not self._usable(time.monotonic()):
+                    raise JWKSError(self._error)
+                return
+
+            now = time.monotonic()
+            if self._attempted_at is not None and now - self._attempted_at < self.min_interval:
+                # the key set was fetched (or failed to be) a moment ago, e.g. while this
+                # lookup was deciding to refresh: do not hammer the issuer
+                if not self._usable(now):
+                    raise JWKSError(self._error)
+                return
+
+            self._fetching = True
+            self._attempted_at = now
+
+        try:
+            keys = self.fetch()
+        except Exception as error:
+            logger.warning('Fetching the key set from %s failed: %s', self.url, error)
+            with self._condition:
+                self._error = error
+                self._fetching = False
+                self._condition.notify_all()
+                if not self._usable(time.monotonic()):
+                    raise JWKSError(error) from error
+            return
+
+        with self._condition:
+            self._keys = keys
+            self._fetched_at = time.monotonic()
+            self._error = None
+            self._fetching = False
+            self._condition.notify_all()
+
+    def refresh_in_background(self):
+        with self._condition:
+            if self._fetching or time.monotonic() - self._attempted_at < self.min_interval:
+                return
+
+        threading.Thread(target=self._refresh_quietly, daemon=True).start()
+
+    def _refresh_quietly(self):
+        try:
+            self.refresh()
+        except JWKSError:
+            pass
+
+    def _usable(self, now):
+        return self._keys is not None and now - self._fetched_at < self.ttl + self.max_stale
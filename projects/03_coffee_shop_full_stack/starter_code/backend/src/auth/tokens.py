@@ -0,0 +1,77 @@
+import hashlib
+import time
+from collections import OrderedDict
+from threading import Lock
+
+
+class Claims(dict):
+    '''
+    The payload of a verified token, with its permissions as a set for O(1) checks
+    '''
+
+    def __init__(self, payload):
+        super().__init__(payload)
+        self.permission_set = frozenset(payload.get('permissions') or ())
+
+
+class TokenCache:
+    '''
+    Payloads of verified tokens, by the SHA-256 hash of the token
+
+    The least recently used tokens are evicted beyond `max_entries`. A token is
+    kept until its `exp` claim, and for at most `max_age` seconds so that a key
+    withdrawn from the key set stops being accepted soon after. Tokens without
+    `exp` are not cached. The cached payloads are shared by all the requests
+    made with a token and must not be modified.
+    '''
+
+    def __init__(self, max_entries=1024, max_age=300):
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self._entries = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, token):
+        '''
+        Returns the Claims of a verified token, None when the token is not cached
+        '''
+        key = hashlib.sha256(token.encode()).digest()
+        now = time.time()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+
+            claims, expires = entry
+            if expires <= now:
+                del self._entries[key]
+                return None
+
+            self._entries.move_to_end(key)
+            return claims
+
+    def put(self, token, payload):
+        '''
+        Caches the payload of a token that was just verified, returns it as Claims
+        '''
+        claims = Claims(payload)
+        exp = payload.get('exp')
+        if not isinstance(exp, (int, float)) or self.max_entries <= 0:
+            return claims
+
+        key = hashlib.sha256(token.encode()).digest()
+        expires = min(exp, time.time() + self.max_age)
+
+        with self._lock:
+            self._entries[key] = (claims, expires)
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+        return claims
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
@@ -1,13 +1,83 @@
 import os
-from sqlalchemy import Column, String, Integer
+import time
+from weakref import WeakSet
+from sqlalchemy import Column, String, Integer, Float, ForeignKey, Index
+from sqlalchemy.orm import relationship
+from sqlalchemy.pool import QueuePool
 from flask_sqlalchemy import SQLAlchemy
+from flask_migrate import Migrate, stamp
 import json
 
 database_filename = "database.db"
 project_dir = os.path.dirname(os.path.abspath(__file__))
-database_path = "sqlite:///{}".format(os.path.join(project_dir, database_filename))
+database_path = os.environ.get("DATABASE_URL", "sqlite:///{}".format(os.path.join(project_dir, database_filename)))
+migrations_dir = os.path.join(os.path.dirname(os.path.dirname(project_dir)), "migrations")
 
 db = SQLAlchemy()
+migrate = Migrate()
+
+'''
+TimedQueuePool
+    a connection pool keeping track of how long checkouts wait for a connection
+'''
+class TimedQueuePool(QueuePool):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.checkouts = 0
+        self.wait_time = 0.0
+        self.max_wait_time = 0.0
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            waited = time.perf_counter() - start
+            self.checkouts += 1
+            self.wait_time += waited
+            self.max_wait_time = max(self.max_wait_time, waited)
+
+'''
+engine_options()
+    the connection pool options, configurable with environment variables
+        DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT (seconds), DB_POOL_RECYCLE (seconds), DB_POOL_PRE_PING (true/false)
+    the pool is only sized for a server database set with DATABASE_URL, the default sqlite database keeps its own pooling
+'''
+def engine_options():
+    options = {
+        'pool_pre_ping': os.environ.get('DB_POOL_PRE_PING', 'true').lower() == 'true',
+        'pool_recycle': int(os.environ.get('DB_POOL_RECYCLE', 1800)),
+    }
+
+    if not database_path.startswith('sqlite'):
+        options.update({
+            'poolclass': TimedQueuePool,
+            'pool_size': int(os.environ.get('DB_POOL_SIZE', 5)),
+            'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW', 10)),
+            'pool_timeout': int(os.environ.get('DB_POOL_TIMEOUT', 30)),
+        })
+
+    return options
+
+'''
+pool_stats()
+    live statistics of the database connection pool
+'''
+def pool_stats():
+    pool = db.engine.pool
+    stats = {'pool': pool.__class__.__name__}
+
+    for name in ['size', 'checkedin', 'checkedout', 'overflow']:
+        if hasattr(pool, name):
+            stats[name] = getattr(pool, name)()
+
+    if isinstance(pool, TimedQueuePool):
+        stats['checkouts'] = pool.checkouts
+        stats['wait_time_total'] = round(pool.wait_time, 6)
+        stats['wait_time_max'] = round(pool.max_wait_time, 6)
+        stats['wait_time_avg'] = round(pool.wait_time / pool.checkouts, 6) if pool.checkouts else 0.0
+
+    return stats
 
 '''
 setup_db(app)
@@ -16,18 +86,50 @@ setup_db(app)
 def setup_db(app):
     app.config["SQLALCHEMY_DATABASE_URI"] = database_path
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    app.config.setdefault("SQLALCHEMY_ENGINE_OPTIONS", engine_options())
     db.app = app
     db.init_app(app)
+    migrate.init_app(app, db, directory=migrations_dir)
 
 '''
 db_drop_and_create_all()
     drops the database tables and starts fresh
     can be used to initialize a clean database
+    the database is stamped with the latest migration, so `flask db upgrade` applies only later ones
     !!NOTE you can change the database_filename variable to have multiple verisons of a database
 '''
 def db_drop_and_create_all():
     db.drop_all()
     db.create_all()
+    with db.app.app_context():
+        stamp(directory=migrations_dir)
+
+'''
+drink_caches
+    caches of drink data, invalidated whenever drinks are inserted, updated or deleted
+    any object with an invalidate() method can be registered with register_cache()
+'''
+drink_caches = WeakSet()
+
+def register_cache(cache):
+    drink_caches.add(cache)
+    return cache
+
+def invalidate_caches():
+    for cache in list(drink_caches):
+        cache.invalidate()
+
+'''
+short_form(drink)
+    the short form representation of a drink from its long form
+    only the color and parts of each ingredient are kept
+'''
+def short_form(drink):
+    return {
+        'id': drink['id'],
+        'title': drink['title'],
+        'recipe': [{'color': r['color'], 'parts': r['parts']} for r in drink['recipe']]
+    }
 
 '''
 Drink
@@ -38,22 +140,38 @@ class Drink(db.Model):
     id = Column(Integer().with_variant(Integer, "sqlite"), primary_key=True)
     # String Title
     title = Column(String(80), unique=True)
-    # the ingredients blob - this stores a lazy json blob
-    # the required datatype is [{'color': string, 'name':string, 'parts':number}]
-    recipe =  Column(String(180), nullable=False)
+    # the recipe, one row per ingredient in recipe order
+    # set with set_recipe([{'color': string, 'name':string, 'parts':number}])
+    ingredients = relationship('Ingredient', order_by='Ingredient.position', lazy='selectin',
+                               cascade='all, delete-orphan')
+
+    '''
+    set_recipe(recipe)
+        replaces the ingredients of the drink with the ones of a recipe
+        the recipe is a list of {'color': string, 'name':string, 'parts':number}
+    '''
+    def set_recipe(self, recipe):
+        self.ingredients = [
+            Ingredient(position=position, name=r['name'], color=r['color'], parts=r['parts'])
+            for position, r in enumerate(recipe)
+        ]
+
+    '''
+    with_ingredient(name)
+        query of the drinks with an ingredient of the given name
+        the filter runs in the database, on the index of the ingredient names
+    '''
+    @classmethod
+    def with_ingredient(cls, name):
+        drink_ids = db.session.query(Ingredient.drink_id).filter(Ingredient.name == name)
+        return cls.query.filter(cls.id.in_(drink_ids))
 
     '''
     short()
         short form representation of the Drink model
     '''
     def short(self):
-        print(json.loads(self.recipe))
-        short_recipe = [{'color': r['color'], 'parts': r['parts']} for r in json.loads(self.recipe)]
-        return {
-            'id': self.id,
-            'title': self.title,
-            'recipe': short_recipe
-        }
+        return short_form(self.long())
 
     '''
     long()
@@ -63,37 +181,40 @@ class Drink(db.Model):
         return {
             'id': self.id,
             'title': self.title,
-            'recipe': json.loads(self.recipe)
+            'recipe': [ingredient.format() for ingredient in self.ingredients]
         }
 
     '''
     insert()
-        inserts a new model into a database
+        inserts a new model into a database and invalidates the drink caches
         the model must have a unique name
         the model must have a unique id or null id
         EXAMPLE
-            drink = Drink(title=req_title, recipe=req_recipe)
+            drink = Drink(title=req_title)
+            drink.set_recipe(req_recipe)
             drink.insert()
     '''
     def insert(self):
         db.session.add(self)
         db.session.commit()
+        invalidate_caches()
 
     '''
     delete()
-        deletes a new model into a database
+        deletes a new model into a database and invalidates the drink caches
         the model must exist in the database
         EXAMPLE
-            drink = Drink(title=req_title, recipe=req_recipe)
+            drink = Drink.query.filter(Drink.id == id).one_or_none()
             drink.delete()
     '''
     def delete(self):
         db.session.delete(self)
         db.session.commit()
+        invalidate_caches()
 
     '''
     update()
-        updates a new model into a database
+        updates a new model into a database and invalidates the drink caches
         the model must exist in the database
         EXAMPLE
             drink = Drink.query.filter(Drink.id == id).one_or_none()
@@ -102,6 +223,37 @@ class Drink(db.Model):
     '''
     def update(self):
         db.session.commit()
+        invalidate_caches()
 
     def __repr__(self):
-        return json.dumps(self.short())
\ No newline at end of file
+        return json.dumps(self.short())
+
+'''
+Ingredient
+an ingredient of the recipe of a drink, in the position given by the recipe
+'''
+class Ingredient(db.Model):
+    id = Column(Integer, primary_key=True)
+    drink_id = Column(Integer, ForeignKey('drink.id', ondelete='CASCADE'), nullable=False)
+    position = Column(Integer, nullable=False)
+    name = Column(String(80), nullable=False)
+    color = Column(String(80), nullable=False)
+    parts = Column(Float, nullable=False)
+
+    __table_args__ = (
+        # drinks by ingredient (Drink.with_ingredient())
+        Index('ix_ingredient_name', 'name'),
+        # the ingredients of drinks, in recipe order
+        Index('ix_ingredient_drink_id_position', 'drink_id', 'position'),
+    )
+
+    '''
+    format()
+        the representation of the ingredient in a recipe
+    '''
+    def format(self):
+        return {
+            'color': self.color,
+            'name': self.name,
+            'parts': int(self.parts) if float(self.parts).is_integer() else self.parts
+        }
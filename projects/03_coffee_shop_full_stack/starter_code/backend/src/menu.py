@@ -0,0 +1,78 @@
+import hashlib
+import json
+import time
+from threading import Lock
+
+from flask import request, Response
+
+from .database.models import Drink, short_form
+
+
+class DrinksMenu:
+    '''
+    The drinks of the menu, serialized once per write
+
+    The JSON bodies of the drinks list in short form (the public menu) and in long
+    form are built together, loading every recipe once, and served as they are
+    until the menu is invalidated by a write. Every write bumps the version of the
+    menu; a menu built while a write happened is not kept, so it can never hide
+    that write. Other processes do not see the invalidation, their menus are
+    rebuilt after `ttl` seconds at the latest. Each body carries an ETag, a
+    client polling with If-None-Match gets a 304 while the menu is unchanged.
+    '''
+
+    def __init__(self, ttl=60):
+        self.ttl = ttl
+        self.version = 0
+        self._menu = None
+        self._build_lock = Lock()
+        self._version_lock = Lock()
+
+    def bodies(self):
+        '''
+        Returns the serialized bodies of the menu with their ETag, by form ('short' or 'long')
+        '''
+        menu = self._menu
+        if self._current(menu):
+            return menu[2]
+
+        with self._build_lock:
+            menu = self._menu
+            if self._current(menu):
+                return menu[2]
+
+            version = self.version
+            drinks = [drink.long() for drink in Drink.query.order_by(Drink.id)]
+            bodies = {
+                'short': self._serialize([short_form(drink) for drink in drinks]),
+                'long': self._serialize(drinks),
+            }
+            if version == self.version:
+                self._menu = (version, time.monotonic() + self.ttl, bodies)
+
+            return bodies
+
+    def response(self, form):
+        '''
+        Returns the response listing the drinks in the given form
+        '''
+        body, etag = self.bodies()[form]
+
+        if request.if_none_match.contains(etag):
+            response = Response(status=304)
+        else:
+            response = Response(body, mimetype='application/json')
+
+        response.set_etag(etag)
+        return response
+
+    def invalidate(self):
+        with self._version_lock:
+            self.version += 1
+
+    def _current(self, menu):
+        return menu is not None and menu[0] == self.version and menu[1] > time.monotonic()
+
+    def _serialize(self, drinks):
+        body = json.dumps({"success": True, "drinks": drinks}).encode('utf-8')
+        return body, hashlib.sha1(body).hexdigest()
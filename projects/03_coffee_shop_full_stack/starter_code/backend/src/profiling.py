@@ -0,0 +1,158 @@
+import os
+import time
+from collections import deque
+from threading import Lock
+
+from flask import g, has_request_context, request, request_started, request_finished, signals_available
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Length of the statement text kept as the slowest statement of a request
+MAX_STATEMENT_LENGTH = 200
+
+_listening = False
+
+
+class RequestProfile:
+    '''
+    The SQL statements of one request: their number, time and rows, and the slowest one
+    '''
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.rows = 0
+        self.slowest_time = 0.0
+        self.slowest_statement = None
+
+    def record(self, statement, elapsed, rows):
+        self.queries += 1
+        self.db_time += elapsed
+        if rows > 0:
+            self.rows += rows
+
+        if elapsed > self.slowest_time:
+            self.slowest_time = elapsed
+            self.slowest_statement = ' '.join(statement.split())[:MAX_STATEMENT_LENGTH]
+
+
+# The start time is kept on the execution context of the statement, which is
+# dropped with it when the statement fails and after_cursor_execute never runs
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._query_profiling_start = time.perf_counter()
+
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    start = getattr(context, '_query_profiling_start', None)
+    if start is None:
+        return
+
+    profile = getattr(g, 'query_profile', None) if has_request_context() else None
+    if profile is not None:
+        profile.record(statement, time.perf_counter() - start, cursor.rowcount)
+
+
+def listen():
+    '''
+    Times the statements of every engine, once per process
+    '''
+    global _listening
+
+    if not _listening:
+        event.listen(Engine, 'before_cursor_execute', before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', after_cursor_execute)
+        _listening = True
+
+
+class QueryProfiler:
+    '''
+    Opt-in profiling of the SQL statements run by each request
+
+    Turned on with the QUERY_PROFILING environment variable (or config value) set
+    to true. Responses then get a Server-Timing header listing the statement count,
+    the rows reported by the database driver, the database time, the slowest
+    statement and the request time, and the last `window` requests per endpoint
+    are kept for report(), which lists the `top` slowest endpoints.
+    '''
+
+    def __init__(self, app=None, top=10, window=100):
+        self.top = top
+        self.window = window
+        self.enabled = False
+        self._endpoints = {}
+        self._lock = Lock()
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        enabled = app.config.get('QUERY_PROFILING', os.environ.get('QUERY_PROFILING', 'false'))
+        self.enabled = enabled is True or str(enabled).lower() == 'true'
+        if not self.enabled:
+            return
+
+        listen()
+
+        if signals_available:
+            request_started.connect(self.start, app, weak=False)
+            request_finished.connect(self.finish, app, weak=False)
+        else:
+            app.before_request(lambda: self.start(app))
+            app.after_request(lambda response: self.finish(app, response))
+
+    def start(self, sender, **extra):
+        g.query_profile = RequestProfile()
+
+    def finish(self, sender, response, **extra):
+        profile = g.pop('query_profile', None)
+        if profile is None:
+            return response
+
+        total = time.perf_counter() - profile.start
+        timings = [
+            'db;dur={:.2f};desc="{} queries, {} rows"'.format(profile.db_time * 1000, profile.queries, profile.rows),
+            'total;dur={:.2f}'.format(total * 1000),
+        ]
+        if profile.slowest_statement:
+            timings.insert(1, 'db-slowest;dur={:.2f}'.format(profile.slowest_time * 1000))
+        response.headers.add('Server-Timing', ', '.join(timings))
+
+        self.add(request.method, request.endpoint, total, profile)
+        return response
+
+    def add(self, method, endpoint, total, profile):
+        key = '{} {}'.format(method, endpoint)
+
+        with self._lock:
+            requests = self._endpoints.get(key)
+            if requests is None:
+                requests = self._endpoints[key] = deque(maxlen=self.window)
+            requests.append((total, profile.db_time, profile.queries, profile.rows, profile.slowest_time, profile.slowest_statement))
+
+    def report(self):
+        '''
+        Returns the slowest endpoints over their last requests, slowest first
+        '''
+        with self._lock:
+            endpoints = {key: list(requests) for key, requests in self._endpoints.items()}
+
+        report = []
+        for key, requests in endpoints.items():
+            count = len(requests)
+            slowest = max(requests, key=lambda entry: entry[4])
+            report.append({
+                'endpoint': key,
+                'requests': count,
+                'avg_ms': round(sum(entry[0] for entry in requests) / count * 1000, 2),
+                'max_ms': round(max(entry[0] for entry in requests) * 1000, 2),
+                'avg_db_ms': round(sum(entry[1] for entry in requests) / count * 1000, 2),
+                'avg_queries': round(sum(entry[2] for entry in requests) / count, 1),
+                'avg_rows': round(sum(entry[3] for entry in requests) / count, 1),
+                'slowest_statement_ms': round(slowest[4] * 1000, 2),
+                'slowest_statement': slowest[5],
+            })
+
+        report.sort(key=lambda entry: entry['avg_ms'], reverse=True)
+        return report[:self.top]
@@ -1,6 +1,6 @@
 import os
 from flask import Flask
-from models import setup_db
+from models import setup_db, db_create_all
 
 def create_app(test_config=None):
 
@@ -8,6 +8,10 @@ def create_app(test_config=None):
     setup_db(app)
     CORS(app)
 
+    @app.cli.command('create-db')
+    def create_db():
+        db_create_all()
+
     @app.route('/')
     def get_greeting():
         excited = os.environ['EXCITED']
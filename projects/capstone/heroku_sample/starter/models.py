@@ -15,6 +15,13 @@ def setup_db(app, database_path=database_path):
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
     db.app = app
     db.init_app(app)
+
+'''
+db_create_all()
+    creates the database tables
+    run it once with `flask create-db` rather than on every app start
+'''
+def db_create_all():
     db.create_all()
 
 